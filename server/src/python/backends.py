@@ -0,0 +1,86 @@
+import os
+import sys
+import numpy as np
+from pathlib import Path
+
+MODELS_DIR = Path(__file__).parent / "models"
+EXPORT_DIR = MODELS_DIR / "exported"
+
+# Backend d'inférence: "torch" (modèles PyTorch d'origine), "torchscript" ou "onnxruntime"
+BACKENDS = ("torch", "torchscript", "onnxruntime")
+BACKEND = os.environ.get("IMAGE_BACKEND", "torch")
+# Utiliser les graphes quantifiés INT8 produits par export_models.py --int8
+QUANTIZED = os.environ.get("IMAGE_BACKEND_INT8", "0") == "1"
+
+def exported_path(name, backend, quantized=False):
+    """Chemin du modèle exporté par export_models.py"""
+    suffix = ".onnx" if backend == "onnxruntime" else ".pt"
+    return EXPORT_DIR / f"{name}{'_int8' if quantized else ''}{suffix}"
+
+class OnnxModule:
+    """Session ONNX Runtime exposée avec l'interface d'un module PyTorch (tenseurs en entrée et en sortie)"""
+
+    def __init__(self, path):
+        import onnxruntime as ort
+        self.session = ort.InferenceSession(str(path), providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, tensor, *args, **kwargs):
+        import torch
+        outputs = self.session.run(None, {self.input_name: tensor.detach().cpu().numpy().astype(np.float32)})
+        outputs = tuple(torch.from_numpy(output) for output in outputs)
+        return outputs if len(outputs) > 1 else outputs[0]
+
+    forward = __call__
+
+    def eval(self):
+        return self
+
+    def to(self, *args, **kwargs):
+        return self
+
+    def cuda(self):
+        return self
+
+class MattingAdapter:
+    """Redonne à un MODNet exporté (qui ne retourne que le matte) l'interface du modèle d'origine"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, tensor, inference=True):
+        return None, None, self.model(tensor)
+
+    def eval(self):
+        return self
+
+    def to(self, *args, **kwargs):
+        return self
+
+def load_backend(name, eager_loader, backend=None, quantized=None):
+    """Charge un modèle avec le backend configuré
+
+    Retombe sur le modèle PyTorch d'origine si le modèle exporté est absent.
+    """
+    backend = backend or BACKEND
+    quantized = QUANTIZED if quantized is None else quantized
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend inconnu: {backend} (attendu: {', '.join(BACKENDS)})")
+    if backend == "torch":
+        return eager_loader()
+
+    path = exported_path(name, backend, quantized)
+    if not path.exists():
+        print(f"Modèle exporté introuvable ({path}), utilisation du modèle PyTorch", file=sys.stderr)
+        return eager_loader()
+
+    if backend == "torchscript":
+        import torch
+        model = torch.jit.load(str(path), map_location="cuda" if torch.cuda.is_available() else "cpu")
+        model.eval()
+    else:
+        model = OnnxModule(path)
+
+    if name == "modnet":
+        model = MattingAdapter(model)
+    return model
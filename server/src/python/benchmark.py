@@ -0,0 +1,562 @@
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import itertools
+import tracemalloc
+from pathlib import Path
+import cv2
+import numpy as np
+
+import image_processor
+from cache import ArrayCache
+from workers import WorkerPool, available_cores
+
+def synthetic_scene(size, seed=0):
+    """Génère une scène synthétique reproductible (dégradé, aplats de couleur et bruit)"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    img = np.dstack([
+        200 * x + 30,
+        150 * y + 50,
+        120 * (1 - x) * y + 80
+    ])
+    for _ in range(12):
+        x0, y0 = rng.integers(0, size, 2)
+        w, h = rng.integers(size // 16, size // 3, 2)
+        img[y0:y0+h, x0:x0+w] = rng.integers(0, 256, 3)
+    img += rng.normal(0, 6, img.shape)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+def synthetic_product(size, seed=0):
+    """Génère un produit synthétique reproductible: un objet arrondi sur un fond clair uni"""
+    rng = np.random.default_rng(seed)
+    img = np.full((size, size, 3), 235, dtype=np.uint8)
+    center = (size // 2, size // 2)
+    axes = (size // 4, size // 3)
+    cv2.ellipse(img, center, axes, 0, 0, 360, (60, 90, 170), -1)
+    cv2.ellipse(img, (center[0] - size // 12, center[1] - size // 8), (size // 16, size // 10), 0, 0, 360, (140, 170, 230), -1)
+    noise = rng.normal(0, 4, img.shape)
+    return np.clip(img + noise, 0, 255).astype(np.uint8)
+
+def timeit(func, repeat=3):
+    """Retourne le meilleur temps (ms) sur plusieurs exécutions et le dernier résultat"""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        best = min(best, (time.perf_counter() - t0) * 1000)
+    return best, result
+
+def hex_to_lab(colors):
+    bgr = np.array([[int(c[5:7], 16), int(c[3:5], 16), int(c[1:3], 16)] for c in colors], dtype=np.float32)
+    return cv2.cvtColor(bgr.reshape(-1, 1, 3) / 255.0, cv2.COLOR_BGR2LAB).reshape(-1, 3)
+
+def palette_delta_e(reference, candidate):
+    """ΔE (CIE76) moyen entre deux palettes, après appariement optimal des couleurs"""
+    ref_lab = hex_to_lab(reference)
+    cand_lab = hex_to_lab(candidate)
+    best = float("inf")
+    for perm in itertools.permutations(range(len(cand_lab)), len(ref_lab)):
+        delta = np.linalg.norm(ref_lab - cand_lab[list(perm)], axis=1).mean()
+        best = min(best, delta)
+    return best
+
+def reference_palette(img, k=5):
+    """Ancienne implémentation: k-means pleine résolution, 10 essais"""
+    pixels = np.float32(img.reshape(-1, 3))
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
+    _, _, centers = cv2.kmeans(pixels, k, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
+    return [f"#{r:02x}{g:02x}{b:02x}" for b, g, r in centers.astype(np.uint8)]
+
+def bench_palette(images):
+    """Palette: k-means pleine résolution vs extract_palette sous-échantillonné"""
+    for name, img in images:
+        # Le k-means de référence n'est pas déterministe: on garde plusieurs exécutions
+        # et on compare au plus proche, en affichant l'écart entre exécutions de référence
+        references = []
+        ref_ms = float("inf")
+        for _ in range(3):
+            elapsed, colors = timeit(lambda: reference_palette(img), repeat=1)
+            ref_ms = min(ref_ms, elapsed)
+            references.append(colors)
+        fast_ms, palette = timeit(lambda: image_processor.extract_palette(img))
+        fast_colors = [entry["color"] for entry in palette]
+        
+        delta_e = min(palette_delta_e(ref, fast_colors) for ref in references)
+        noise = max(palette_delta_e(references[0], ref) for ref in references[1:])
+        print(f"palette {name}: référence {ref_ms:.1f} ms, rapide {fast_ms:.1f} ms "
+              f"(x{ref_ms / fast_ms:.1f}), ΔE moyen {delta_e:.2f} "
+              f"(écart entre exécutions de référence: {noise:.2f})")
+
+def reference_lighting(image, lighting_info):
+    """Ancienne implémentation: masque plein cadre et flou complet par tache, boucle par canal"""
+    result = image.copy()
+    height, width = image.shape[:2]
+    masks = []
+    for spots in (lighting_info['shadows'], lighting_info['highlights']):
+        mask = np.zeros((height, width), dtype=np.float32)
+        for spot in spots:
+            center = (int(spot['x'] * width), int(spot['y'] * height))
+            radius = int(spot['radius'])
+            temp_mask = np.zeros((height, width), dtype=np.float32)
+            cv2.circle(temp_mask, center, radius, 1, -1)
+            temp_mask = cv2.GaussianBlur(temp_mask, (radius*2+1, radius*2+1), radius/3)
+            mask = cv2.add(mask, temp_mask)
+        masks.append(cv2.normalize(mask, None, 0, 0.5, cv2.NORM_MINMAX))
+    shadow_mask, highlight_mask = masks
+    result = result.astype(np.float32)
+    for i in range(3):
+        result[:,:,i] = result[:,:,i] * (1 - shadow_mask)
+        result[:,:,i] = result[:,:,i] + (255 - result[:,:,i]) * highlight_mask
+    return cv2.convertScaleAbs(result)
+
+def bench_lighting(images):
+    """Effets d'éclairage: ancienne implémentation vs flou limité à la zone de chaque tache"""
+    for name, img in images:
+        height = img.shape[0]
+        for fraction in (0.05, 0.1, 0.2, 0.3):
+            radius = int(height * fraction)
+            lighting_info = {
+                'shadows': [{'x': 0.55, 'y': 0.55, 'radius': radius}],
+                'highlights': [{'x': 0.45, 'y': 0.45, 'radius': int(radius * 2 / 3)}]
+            }
+            ref_ms, reference = timeit(lambda: reference_lighting(img, lighting_info), repeat=1)
+            fast_ms, result = timeit(lambda: image_processor.apply_lighting_effects(img, lighting_info))
+            diff = np.abs(reference.astype(np.int16) - result[:, :, :3].astype(np.int16))
+            print(f"éclairage {name}, rayon {radius}px: référence {ref_ms:.1f} ms, rapide {fast_ms:.1f} ms "
+                  f"(x{ref_ms / fast_ms:.1f}), écart max {diff.max()}, moyen {diff.mean():.3f}")
+
+def reference_color_transfer(source, target):
+    """Ancienne implémentation: statistiques float64 sur toute l'image, écriture canal par canal en uint8"""
+    source_lab = cv2.cvtColor(source, cv2.COLOR_BGR2LAB)
+    target_lab = cv2.cvtColor(target, cv2.COLOR_BGR2LAB)
+    source_mean = np.mean(source_lab.reshape(-1, 3), axis=0)
+    source_std = np.std(source_lab.reshape(-1, 3), axis=0)
+    target_mean = np.mean(target_lab.reshape(-1, 3), axis=0)
+    target_std = np.std(target_lab.reshape(-1, 3), axis=0)
+    result = np.copy(source_lab)
+    for i in range(3):
+        result[:,:,i] = ((result[:,:,i] - source_mean[i]) * (target_std[i] / source_std[i])) + target_mean[i]
+    result = cv2.cvtColor(result, cv2.COLOR_LAB2BGR)
+    return cv2.convertScaleAbs(result)
+
+def bench_color_transfer(images):
+    """Transfert de couleur de Reinhard: ancienne implémentation vs ColorManager (float32, une passe)"""
+    for name, img in images:
+        target = synthetic_scene(img.shape[0], seed=1)[:, :img.shape[1]]
+        ref_ms, reference = timeit(lambda: reference_color_transfer(img, target), repeat=1)
+        fast_ms, result = timeit(lambda: image_processor.ColorManager(img, target).color_transfer())
+        diff = np.abs(reference.astype(np.int16) - result.astype(np.int16))
+        print(f"transfert de couleur {name}: référence {ref_ms:.1f} ms, rapide {fast_ms:.1f} ms "
+              f"(x{ref_ms / fast_ms:.1f}), écart moyen {diff.mean():.3f} "
+              f"(l'ancienne version déborde en uint8: {(diff > 8).mean() * 100:.2f}% des pixels diffèrent de plus de 8)")
+
+def reference_grabcut(img):
+    """Ancienne implémentation: filtre bilatéral et 5 itérations de GrabCut en pleine résolution"""
+    img_filtered = cv2.bilateralFilter(img, 9, 75, 75)
+    mask = np.zeros(img.shape[:2], np.uint8)
+    rect = (10, 10, img.shape[1]-20, img.shape[0]-20)
+    bgdModel = np.zeros((1,65), np.float64)
+    fgdModel = np.zeros((1,65), np.float64)
+    cv2.grabCut(img_filtered, mask, rect, bgdModel, fgdModel, 5, cv2.GC_INIT_WITH_RECT)
+    mask2 = np.where((mask==2)|(mask==0), 0, 1).astype('uint8')
+    return cv2.GaussianBlur(mask2, (5,5), 0) * 255
+
+def mask_iou(reference, candidate):
+    a = reference > 127
+    b = candidate > 127
+    union = np.logical_or(a, b).sum()
+    return 1.0 if union == 0 else np.logical_and(a, b).sum() / union
+
+def bench_grabcut(images):
+    """GrabCut: pleine résolution vs segmentation réduite et affinage de la bande du contour"""
+    for name, img in images:
+        ref_ms, reference = timeit(lambda: reference_grabcut(img), repeat=1)
+        fast_ms, result = timeit(lambda: image_processor.remove_background_grabcut(img))
+        print(f"grabcut {name}: référence {ref_ms:.1f} ms, multi-échelle {fast_ms:.1f} ms "
+              f"(x{ref_ms / fast_ms:.1f}), IoU {mask_iou(reference, result[:, :, 3]):.4f}")
+
+def bench_segmentation(images):
+    """Routage de la segmentation: route choisie, coût du routage et de la route contre U²-Net"""
+    image_processor._cache = ArrayCache(max_bytes=0)
+    stubbed = install_stub_models()
+    if stubbed:
+        print(f"Poids absents, modèles remplacés par des substituts: {', '.join(stubbed)}")
+    for name, img in images:
+        classify_ms, (route, details) = timeit(lambda: image_processor.classify_product(img))
+        u2net_ms, reference = timeit(lambda: image_processor.remove_background_u2net(img))
+        line = f"segmentation {name}: route {route} {details}, classification {classify_ms:.1f} ms, U²-Net {u2net_ms:.1f} ms"
+        if route != "u2net":
+            try:
+                route_ms, result = timeit(lambda: image_processor.SEGMENTERS[route](img))
+                line += f", {route} {route_ms:.1f} ms"
+                if result is not None:
+                    line += f" (x{u2net_ms / (classify_ms + route_ms):.1f}), IoU avec U²-Net {mask_iou(reference[:, :, 3], result[:, :, 3]):.4f}"
+            except Exception as e:
+                line += f", {route} indisponible ({str(e)})"
+        print(line)
+
+def product_ground_truth(img, threshold=30):
+    """Masque de référence d'un produit sur fond uni (couleur du coin supérieur gauche)"""
+    distance = np.abs(img.astype(np.int16) - img[0, 0].astype(np.int16)).max(axis=2)
+    return (distance > threshold).astype(np.float32)
+
+def reference_mask_upsampling(pred, size):
+    """Ancienne implémentation: redimensionnement bilinéaire puis flou gaussien 5×5"""
+    mask = (cv2.resize(pred, size) * 255).astype(np.uint8)
+    return cv2.GaussianBlur(mask, (5, 5), 0)
+
+def bench_mask_refinement(images):
+    """Masques U²-Net: redimensionnement + flou vs filtre guidé rapide en pleine résolution
+    
+    La carte U²-Net est simulée en réduisant le masque de référence à 320 px, ce qui isole
+    la qualité du retour à la pleine résolution. L'erreur est mesurée près des contours.
+    """
+    for name, img in images:
+        truth = product_ground_truth(img)
+        height, width = truth.shape
+        pred = cv2.resize(truth, image_processor.fit_size(width, height, image_processor.U2NET_SIZE), interpolation=cv2.INTER_AREA)
+        edges = cv2.morphologyEx(truth, cv2.MORPH_GRADIENT, np.ones((9, 9), np.uint8)) > 0
+        
+        ref_ms, reference = timeit(lambda: reference_mask_upsampling(pred, (width, height)))
+        fast_ms, refined = timeit(lambda: image_processor.refine_u2net_mask(img, pred))
+        ref_error = np.abs(reference[edges] / 255.0 - truth[edges]).mean()
+        fast_error = np.abs(refined[edges] / 255.0 - truth[edges]).mean()
+        print(f"affinage U²-Net {name}: référence {ref_ms:.1f} ms, filtre guidé {fast_ms:.1f} ms "
+              f"({width * height / 1e6 / (fast_ms / 1000):.0f} Mpx/s), erreur aux contours "
+              f"{ref_error:.4f} -> {fast_error:.4f}")
+
+def poisson_case(scene):
+    """Produit synthétique (40 % de la hauteur de la scène) centré, avec son alpha et le masque binaire"""
+    side = int(min(scene.shape[:2]) * 0.4)
+    product = synthetic_product(side, seed=1)
+    alpha = cv2.GaussianBlur((product_ground_truth(product) * 255).astype(np.uint8), (5, 5), 0)
+    x = (scene.shape[1] - side) // 2
+    y = (scene.shape[0] - side) // 2
+    return product, alpha, x, y
+
+def calibrate_poisson(images):
+    """Étalonne le modèle de coût de poisson_blend_into (pixels de la zone par ms)
+
+    Coûts fixes: fusion réduite au niveau le plus petit possible; résolution: pleine résolution
+    moins les coûts fixes. Retourne (POISSON_FIXED_PIXELS_PER_MS, POISSON_PIXELS_PER_MS).
+    """
+    fixed_rates = []
+    solve_rates = []
+    for _, scene in images:
+        product, alpha, x, y = poisson_case(scene)
+        area = (product.shape[0] + 2 * image_processor.POISSON_MARGIN) * (product.shape[1] + 2 * image_processor.POISSON_MARGIN)
+        fixed_ms, _ = timeit(lambda: image_processor.poisson_blend_into(scene.copy(), product, alpha, x, y, 1e-6))
+        full_ms, _ = timeit(lambda: image_processor.poisson_blend_into(scene.copy(), product, alpha, x, y, 0))
+        fixed_rates.append(area / fixed_ms)
+        solve_rates.append(area / max(full_ms - fixed_ms, 1e-3))
+    return float(np.median(fixed_rates)), float(np.median(solve_rates))
+
+def bench_poisson(images):
+    """Fusion: alpha contre seamlessClone plein cadre et Poisson multigrille limité à la zone du produit
+
+    L'erreur est l'écart moyen avec seamlessClone (NORMAL_CLONE) à l'intérieur du masque. Le
+    modèle de coût est d'abord étalonné sur cette machine, puis chaque budget est comparé à la
+    durée mesurée.
+    """
+    fixed_rate, solve_rate = calibrate_poisson(images)
+    print(f"étalonnage: IMAGE_POISSON_FIXED_PIXELS_PER_MS={fixed_rate:.0f} IMAGE_POISSON_PIXELS_PER_MS={solve_rate:.0f} "
+          f"(actuels {image_processor.POISSON_FIXED_PIXELS_PER_MS:.0f} et {image_processor.POISSON_PIXELS_PER_MS:.0f})")
+    image_processor.POISSON_FIXED_PIXELS_PER_MS = fixed_rate
+    image_processor.POISSON_PIXELS_PER_MS = solve_rate
+
+    for name, scene in images:
+        product, alpha, x, y = poisson_case(scene)
+        mask = (alpha > 127).astype(np.uint8) * 255
+        bx, by, bw, bh = cv2.boundingRect(mask)
+        center = (x + bx + bw // 2, y + by + bh // 2)
+        inside = np.zeros(scene.shape[:2], bool)
+        side = product.shape[0]
+        inside[y:y + side, x:x + side] = alpha > 127
+
+        def run(blend):
+            out = scene.copy()
+            blend(out)
+            return out
+
+        clone_ms, reference = timeit(lambda: cv2.seamlessClone(product, scene, mask, center, cv2.NORMAL_CLONE), repeat=1)
+        alpha_ms, result = timeit(lambda: run(lambda out: image_processor.blend_into(out, product, alpha, x, y)))
+        error = np.abs(result.astype(np.float32) - reference)[inside].mean()
+        line = f"fusion {name}: seamlessClone {clone_ms:.1f} ms, alpha {alpha_ms:.1f} ms (écart {error:.2f})"
+        for budget in (0, 50, 20, 10):
+            poisson_ms, result = timeit(lambda: run(lambda out: image_processor.poisson_blend_into(out, product, alpha, x, y, budget)))
+            error = np.abs(result.astype(np.float32) - reference)[inside].mean()
+            line += f", Poisson budget {budget or 'aucun'} {poisson_ms:.1f} ms (écart {error:.2f})"
+        print(line)
+
+def stub_u2net():
+    """Substitut de U²-Net quand les poids sont absents: un masque elliptique centré"""
+    import torch
+
+    class StubU2Net(torch.nn.Module):
+        def forward(self, x):
+            height, width = x.shape[2:]
+            y = torch.linspace(-1, 1, height).view(-1, 1)
+            x_coords = torch.linspace(-1, 1, width).view(1, -1)
+            d0 = torch.sigmoid(8 * (0.5 - (x_coords / 0.6) ** 2 - (y / 0.7) ** 2))
+            d0 = d0.expand(x.shape[0], 1, height, width)
+            return (d0,) * 7
+
+    return StubU2Net()
+
+def stub_estimate_depth(model, image):
+    """Substitut de MiDaS: profondeur croissant vers le bas de l'image"""
+    if model is not None:
+        return midas_estimate_depth(model, image)
+    height, width = image.shape[:2]
+    return np.repeat(np.linspace(0, 1, height, dtype=np.float32)[:, None], width, axis=1)
+
+midas_estimate_depth = image_processor.midas_estimate_depth
+
+def install_stub_models():
+    """Remplace les modèles dont les poids sont absents par des substituts; retourne leurs noms"""
+    stubbed = []
+    try:
+        image_processor.get_u2net()
+    except Exception:
+        image_processor._u2net_model = stub_u2net()
+        stubbed.append("u2net")
+
+    model_type = image_processor.DEPTH_TIERS[image_processor.ANALYSIS_DEPTH_QUALITY][0]
+    try:
+        image_processor.get_midas(model_type)
+    except Exception:
+        image_processor._midas_models[model_type] = None
+        image_processor.midas_estimate_depth = stub_estimate_depth
+        stubbed.append(model_type)
+    return stubbed
+
+def suite_cases(size):
+    """(nom, fonction) de chaque fonction publique mesurée, sur une scène et un produit de côté size"""
+    scene = synthetic_scene(size)
+    product = synthetic_product(size, seed=1)
+    product_rgba = image_processor.remove_background_u2net(product)
+    style_guide = image_processor.build_style_guide(image_processor.SceneAnalyzer(scene))
+    l_source = cv2.cvtColor(product, cv2.COLOR_BGR2LAB)[:, :, 0]
+    l_target = cv2.cvtColor(scene, cv2.COLOR_BGR2LAB)[:, :, 0]
+    lighting = {
+        'shadows': [{'x': 0.55, 'y': 0.55, 'radius': int(size * 0.3)}],
+        'highlights': [{'x': 0.45, 'y': 0.45, 'radius': int(size * 0.2)}]
+    }
+    return [
+        ("remove_background_u2net", lambda: image_processor.remove_background_u2net(product)),
+        ("remove_background_grabcut", lambda: image_processor.remove_background_grabcut(product)),
+        ("remove_background", lambda: image_processor.remove_background(product)),
+        ("analyze_style", lambda: image_processor.analyze_style(scene)),
+        ("color_transfer", lambda: image_processor.ColorManager(product, scene).color_transfer()),
+        ("match_histograms", lambda: image_processor.ColorManager(product, scene).match_histograms(l_source, l_target)),
+        ("apply_lighting_effects", lambda: image_processor.apply_lighting_effects(product_rgba, lighting)),
+        ("integrate_product", lambda: image_processor.integrate_product(product_rgba, scene, style_guide)),
+        ("find_optimal_placement", lambda: image_processor.SceneAnalyzer(scene).find_optimal_placement()),
+        ("find_placements", lambda: image_processor.SceneAnalyzer(scene).find_placements((size // 3, size // 2), k=3)),
+    ]
+
+def peak_allocation_mb(func):
+    """Pic des allocations Python/NumPy pendant un appel (hors tampons internes d'OpenCV et de PyTorch)"""
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+def run_suite(sizes, functions=None, repeat=3):
+    """Mesure chaque fonction à chaque taille; retourne le rapport (métadonnées et résultats)"""
+    # Le cache disque fausserait les mesures d'inférence
+    image_processor._cache = ArrayCache(max_bytes=0)
+    stubbed = install_stub_models()
+    if stubbed:
+        print(f"Poids absents, modèles remplacés par des substituts: {', '.join(stubbed)}")
+
+    results = {}
+    for size in sizes:
+        megapixels = size * size / 1e6
+        for name, func in suite_cases(size):
+            if functions and name not in functions:
+                continue
+            # Les très grandes images ne sont mesurées qu'une fois (GrabCut 4K prend plusieurs secondes)
+            elapsed, _ = timeit(func, repeat=repeat if size <= 2048 else 1)
+            results[f"{name}@{size}"] = {
+                "function": name,
+                "size": size,
+                "ms": round(elapsed, 3),
+                "mpix_per_s": round(megapixels / (elapsed / 1000), 3),
+                "peak_mb": round(peak_allocation_mb(func), 3)
+            }
+            print(f"{name} {size}px: {elapsed:.1f} ms, {megapixels / (elapsed / 1000):.2f} Mpx/s, "
+                  f"pic {results[f'{name}@{size}']['peak_mb']:.1f} Mo")
+
+    import torch
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "torch": torch.__version__,
+            "threads": cv2.getNumThreads(),
+            "stubbed": stubbed
+        },
+        "results": results
+    }
+
+def find_regressions(report, baseline, threshold=0.2):
+    """Compare un rapport à une référence; retourne les mesures dégradées de plus de threshold"""
+    if baseline["meta"].get("stubbed") != report["meta"]["stubbed"]:
+        print("Attention: la référence n'a pas été mesurée avec les mêmes modèles substitués")
+
+    regressions = []
+    for key, result in report["results"].items():
+        reference = baseline["results"].get(key)
+        if reference is None:
+            continue
+        # Une marge absolue évite de signaler le bruit des mesures de quelques millisecondes
+        for metric, margin in (("ms", 1.0), ("peak_mb", 1.0)):
+            if result[metric] > reference[metric] * (1 + threshold) + margin:
+                regressions.append({
+                    "case": key,
+                    "metric": metric,
+                    "baseline": reference[metric],
+                    "current": result[metric],
+                    "ratio": round(result[metric] / max(reference[metric], 1e-9), 2)
+                })
+    return regressions
+
+def bench_suite(options):
+    """Suite complète: toutes les fonctions publiques, référence JSON et détection de régressions"""
+    report = run_suite(options.sizes or SUITE_SIZES, options.functions, options.repeat)
+
+    if options.save:
+        with open(options.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Référence enregistrée: {options.save}")
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(report, baseline, options.threshold)
+        for regression in regressions:
+            print(f"RÉGRESSION {regression['case']} ({regression['metric']}): "
+                  f"{regression['baseline']} -> {regression['current']} (x{regression['ratio']})")
+        if regressions:
+            return 1
+        print(f"Aucune régression par rapport à {options.baseline} (seuil {options.threshold:.0%})")
+    return 0
+
+def worker_configs(cores):
+    """(workers, threads par worker) à mesurer: puissances de 2 sans dépasser le nombre de cœurs"""
+    counts = sorted({2 ** i for i in range(cores.bit_length()) if 2 ** i <= cores} | {cores})
+    return [(workers, threads) for workers in counts for threads in counts if workers * threads <= cores]
+
+def run_worker_config(requests, workers, threads):
+    """Traite toutes les requêtes avec un pool; retourne (débit en requêtes/s, latences en ms)"""
+    with WorkerPool(image_processor.handle_request, workers, threads) as pool:
+        # Une requête par worker pour amorcer (imports, premiers appels OpenCV)
+        for future in [pool.submit(request) for request in requests[:workers]]:
+            future.result()
+
+        latencies = []
+        start = time.perf_counter()
+        futures = []
+        for request in requests:
+            submitted = time.perf_counter()
+            future = pool.submit(request)
+            future.add_done_callback(lambda f, t=submitted: latencies.append((time.perf_counter() - t) * 1000))
+            futures.append(future)
+        for future in futures:
+            if not future.result()["success"]:
+                raise Exception(future.result()["error"])
+        elapsed = time.perf_counter() - start
+    return len(requests) / elapsed, sorted(latencies)
+
+def bench_workers(options):
+    """Balaye nombre de workers x threads par worker sur des requêtes process synthétiques"""
+    image_processor._cache = ArrayCache(max_bytes=0)
+    # Modèles chargés (ou substitués) avant le fork: partagés par tous les workers
+    stubbed = install_stub_models()
+    if stubbed:
+        print(f"Poids absents, modèles remplacés par des substituts: {', '.join(stubbed)}")
+
+    cores = len(available_cores())
+    size = (options.sizes or [1024])[0]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        scene_path = Path(tmp) / "scene.png"
+        product_path = Path(tmp) / "product.png"
+        cv2.imwrite(str(scene_path), synthetic_scene(size))
+        cv2.imwrite(str(product_path), synthetic_product(size // 2, seed=1))
+        requests = [
+            {"id": str(i), "command": "process", "args": {
+                "generated_path": str(scene_path),
+                "product_path": str(product_path),
+                "output_path": str(Path(tmp) / f"out_{i}.png")
+            }}
+            for i in range(options.requests)
+        ]
+
+        for workers, threads in worker_configs(cores):
+            throughput, latencies = run_worker_config(requests, workers, threads)
+            p50 = latencies[len(latencies) // 2]
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            results.append({"workers": workers, "threads": threads, "throughput": throughput, "p50_ms": p50, "p95_ms": p95})
+            print(f"{workers} worker(s) x {threads} thread(s) sur {cores} cœur(s), {size}px: "
+                  f"{throughput:.2f} requêtes/s, latence p50 {p50:.0f} ms, p95 {p95:.0f} ms")
+
+    best = max(results, key=lambda result: result["throughput"])
+    print(f"Meilleur débit: --workers {best['workers']} --threads-per-worker {best['threads']}")
+    return results
+
+SUITE_SIZES = [512, 1024, 2048, 4096]
+PRODUCT_BENCHMARKS = {"grabcut", "mask_refinement", "segmentation"}
+
+BENCHMARKS = {
+    "color_transfer": bench_color_transfer,
+    "grabcut": bench_grabcut,
+    "palette": bench_palette,
+    "poisson": bench_poisson,
+    "lighting": bench_lighting,
+    "mask_refinement": bench_mask_refinement,
+    "segmentation": bench_segmentation,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks des étapes de image_processor")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS) + ["suite", "workers"])
+    parser.add_argument("images", nargs="*", help="Images réelles à utiliser (scènes synthétiques sinon)")
+    parser.add_argument("--sizes", type=int, nargs="+")
+    parser.add_argument("--functions", nargs="+", help="suite: fonctions à mesurer (toutes par défaut)")
+    parser.add_argument("--repeat", type=int, default=3, help="suite: nombre d'exécutions (meilleur temps retenu)")
+    parser.add_argument("--save", help="suite: enregistre les résultats comme référence JSON")
+    parser.add_argument("--baseline", help="suite: référence JSON à comparer")
+    parser.add_argument("--threshold", type=float, default=0.2, help="suite: dégradation tolérée (0.2 = 20%%)")
+    parser.add_argument("--requests", type=int, default=16, help="workers: requêtes par configuration")
+    options = parser.parse_args()
+
+    if options.benchmark == "suite":
+        sys.exit(bench_suite(options))
+    if options.benchmark == "workers":
+        bench_workers(options)
+        sys.exit(0)
+
+    if options.sizes is None:
+        options.sizes = [1024, 2048]
+    if options.images:
+        images = [(path, image_processor.load_image(path)) for path in options.images]
+    else:
+        # Les benchmarks de détourage portent sur des photos de produit
+        generate = synthetic_product if options.benchmark in PRODUCT_BENCHMARKS else synthetic_scene
+        images = [(f"synthétique {size}px", generate(size)) for size in options.sizes]
+
+    BENCHMARKS[options.benchmark](images)
+    sys.exit(0)
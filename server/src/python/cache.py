@@ -0,0 +1,112 @@
+import os
+import hashlib
+import tempfile
+import threading
+import numpy as np
+from pathlib import Path
+import profiling
+
+# Configuration du cache (surchargeable par variables d'environnement)
+CACHE_DIR = Path(os.environ.get("IMAGE_CACHE_DIR", Path(__file__).parent / ".cache"))
+CACHE_MAX_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+class ArrayCache:
+    """Cache disque adressé par contenu pour les résultats d'inférence (masques, cartes de profondeur)
+
+    Chaque entrée est un fichier .npy dont le nom est le hash de l'image et du modèle.
+    Les écritures passent par un fichier temporaire renommé atomiquement, ce qui permet
+    à plusieurs workers de partager le même répertoire. La taille totale est bornée:
+    les entrées les moins récemment utilisées sont supprimées en premier.
+    """
+
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    @staticmethod
+    def make_key(image, model, version):
+        """Clé de cache: hash des pixels de l'image + nom et version du modèle"""
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"{model}:{version}:{image.shape}:{image.dtype}".encode("utf-8"))
+        digest.update(np.ascontiguousarray(image).data)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return self.root / key[:2] / f"{key}.npy"
+
+    def get(self, key):
+        """Retourne le tableau en cache ou None"""
+        path = self._path(key)
+        array = None
+        if self.enabled:
+            try:
+                array = np.load(path, allow_pickle=False)
+                os.utime(path)  # Marque l'entrée comme récemment utilisée
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError):
+                # Entrée corrompue ou supprimée pendant la lecture: on la traite comme absente
+                path.unlink(missing_ok=True)
+
+        with self._lock:
+            if array is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        profiling.count("cache_miss" if array is None else "cache_hit")
+        return array
+
+    def put(self, key, array):
+        """Enregistre un tableau de façon atomique puis applique la limite de taille"""
+        if not self.enabled:
+            return
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, array, allow_pickle=False)
+            os.replace(tmp_path, path)
+        except Exception:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+        self.evict()
+
+    def _entries(self):
+        entries = []
+        for path in self.root.glob("*/*.npy"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue  # Supprimé par un autre worker
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        """Supprime les entrées les plus anciennes tant que la taille dépasse la limite"""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def stats(self):
+        """Compteurs de hits/misses et occupation du cache"""
+        entries = self._entries() if self.enabled else []
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries)
+        }
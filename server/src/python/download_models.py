@@ -1,77 +1,207 @@
 import os
-import shutil
+import json
+import time
+import hashlib
+import argparse
+import threading
+import urllib.request
+from urllib.error import HTTPError, URLError
+from http.client import HTTPException
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 MODELS_DIR = Path(__file__).parent / "models"
 PROJECT_ROOT = Path(__file__).parent.parent.parent.parent
 
-# Configuration des modèles
+# Empreintes SHA-256 vérifiées: celles du manifeste, sinon celles enregistrées au premier téléchargement
+CHECKSUMS_FILE = "checksums.json"
+
+# Téléchargements simultanés, tentatives (chacune reprend là où la précédente s'est arrêtée)
+DOWNLOAD_WORKERS = int(os.environ.get("MODEL_DOWNLOAD_WORKERS", "3"))
+DOWNLOAD_RETRIES = 5
+CHUNK_SIZE = 1024 * 1024
+
+# Configuration des modèles ("sha256": empreinte attendue si elle est connue)
 MODELS = {
     "u2net": {
         "url": "https://drive.google.com/uc?id=1ao1ovG1Qtx4b7EoskHXmi2E9rp5CHLcZ",
-        "local_name": "U2NET.pth"
+        "local_name": "U2NET.pth",
+        "sha256": None
     },
     "midas": {
         "url": "https://github.com/isl-org/MiDaS/releases/download/v3.1/dpt_beit_large_512.pt",
-        "local_name": "dpt_beit_large_512.pt"
+        "local_name": "dpt_beit_large_512.pt",
+        "sha256": None
+    },
+    "midas_hybrid": {
+        "url": "https://github.com/isl-org/MiDaS/releases/download/v3/dpt_hybrid_384.pt",
+        "local_name": "dpt_hybrid_384.pt",
+        "sha256": None
+    },
+    "midas_small": {
+        "url": "https://github.com/isl-org/MiDaS/releases/download/v2_1/midas_v21_small_256.pt",
+        "local_name": "midas_v21_small_256.pt",
+        "sha256": None
     },
     "modnet": {
         "url": "https://drive.google.com/uc?id=1mcr7ALciuAsHCpLnrtG_eop5-EYhbCmz",
-        "local_name": "modnet_photographic_portrait_matting.ckpt"
+        "local_name": "modnet_photographic_portrait_matting.ckpt",
+        "sha256": None
     }
 }
 
-def download_file(url, local_path):
-    """Télécharge un fichier depuis une URL"""
-    print(f"Téléchargement vers {local_path}...")
+# Les téléchargements parallèles mettent à jour checksums.json
+_checksums_lock = threading.Lock()
+
+class ChecksumError(Exception):
+    pass
+
+def sha256_file(path, digest=None):
+    """Empreinte SHA-256 d'un fichier (ou suite d'un hash déjà commencé)"""
+    digest = digest or hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest
+
+def load_checksums(models_dir=MODELS_DIR):
+    path = Path(models_dir) / CHECKSUMS_FILE
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def record_checksum(local_name, sha256, models_dir=MODELS_DIR):
+    """Enregistre l'empreinte d'un fichier téléchargé (écriture atomique)"""
+    with _checksums_lock:
+        checksums = load_checksums(models_dir)
+        checksums[local_name] = sha256
+        path = Path(models_dir) / CHECKSUMS_FILE
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(checksums, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+
+def expected_checksum(model_info, models_dir=MODELS_DIR):
+    return model_info.get("sha256") or load_checksums(models_dir).get(model_info["local_name"])
+
+def _fetch(url, part_path, digest):
+    """Une tentative: reprend part_path avec un en-tête Range; retourne (fichier complet, hash)"""
+    offset = part_path.stat().st_size if part_path.exists() else 0
+    request = urllib.request.Request(url, headers={"Range": f"bytes={offset}-"} if offset else {})
     try:
-        if "drive.google.com" in url:
-            import gdown
-            gdown.download(url, str(local_path), quiet=False)
+        response = urllib.request.urlopen(request, timeout=60)
+    except HTTPError as e:
+        if e.code == 416:  # Plage invalide: le fichier partiel est déjà complet
+            return True, digest
+        raise
+
+    with response:
+        if offset and response.status != 206:
+            # Le serveur ignore Range: on repart de zéro
+            offset = 0
+            digest = hashlib.sha256()
+        total = response.headers.get("Content-Length")
+        total = offset + int(total) if total is not None else None
+
+        with open(part_path, "ab" if offset else "wb") as f:
+            for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+                f.write(chunk)
+                digest.update(chunk)
+            size = f.tell()
+
+    return total is None or size >= total, digest
+
+def download_file(url, local_path, sha256=None, retries=DOWNLOAD_RETRIES):
+    """Télécharge un fichier, reprend un téléchargement interrompu et vérifie son SHA-256
+
+    Les données arrivent dans local_path + ".part", renommé une fois complet et vérifié.
+    Retourne l'empreinte SHA-256 du fichier.
+    """
+    local_path = Path(local_path)
+    part_path = local_path.with_name(local_path.name + ".part")
+    print(f"Téléchargement vers {local_path}...")
+
+    if "drive.google.com" in url:
+        import gdown
+        gdown.download(url, str(part_path), quiet=True, resume=True)
+        digest = sha256_file(part_path)
+    else:
+        # Le hash reprend lui aussi là où le fichier partiel s'arrête
+        digest = sha256_file(part_path) if part_path.exists() else hashlib.sha256()
+        for attempt in range(retries):
+            try:
+                complete, digest = _fetch(url, part_path, digest)
+                if complete:
+                    break
+            except (URLError, HTTPException, OSError) as e:
+                if isinstance(e, HTTPError) and e.code < 500:
+                    raise
+                print(f"Téléchargement interrompu ({str(e)}), reprise...")
+                time.sleep(min(2 ** attempt, 30))
         else:
-            import requests
-            from tqdm import tqdm
-            response = requests.get(url, stream=True)
-            response.raise_for_status()
-            
-            total_size = int(response.headers.get('content-length', 0))
-            block_size = 8192
-            progress_bar = tqdm(total=total_size, unit='iB', unit_scale=True)
-            
-            with open(local_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=block_size):
-                    progress_bar.update(len(chunk))
-                    f.write(chunk)
-            
-            progress_bar.close()
-        
-        print(f"Téléchargement terminé: {local_path}")
-        return True
-    except Exception as e:
-        print(f"Erreur lors du téléchargement vers {local_path}: {str(e)}")
-        return False
-
-def setup_models():
-    """Configure tous les modèles nécessaires"""
-    MODELS_DIR.mkdir(parents=True, exist_ok=True)
-    
-    for model_name, model_info in MODELS.items():
-        local_path = MODELS_DIR / model_info["local_name"]
-        if not local_path.exists():
-            success = download_file(model_info["url"], local_path)
-            if not success:
-                print(f"Échec du téléchargement de {model_name}")
-
-def verify_models():
-    """Vérifie que tous les modèles sont présents"""
+            raise IOError(f"Téléchargement incomplet après {retries} tentatives: {url}")
+
+    actual = digest.hexdigest()
+    if sha256 is not None and actual != sha256:
+        part_path.unlink(missing_ok=True)
+        raise ChecksumError(f"SHA-256 invalide pour {local_path.name}: {actual} (attendu {sha256})")
+    os.replace(part_path, local_path)
+    print(f"Téléchargement terminé: {local_path}")
+    return actual
+
+def setup_model(name, models_dir=MODELS_DIR, manifest=MODELS):
+    """Télécharge (ou reprend) un modèle s'il manque"""
+    model_info = manifest[name]
+    local_path = Path(models_dir) / model_info["local_name"]
+    if not local_path.exists():
+        sha256 = download_file(model_info["url"], local_path, expected_checksum(model_info, models_dir))
+        record_checksum(model_info["local_name"], sha256, models_dir)
+    return local_path
+
+def setup_models(names=None, models_dir=MODELS_DIR, manifest=MODELS, workers=DOWNLOAD_WORKERS):
+    """Configure tous les modèles nécessaires (téléchargements en parallèle); retourne les échecs"""
+    Path(models_dir).mkdir(parents=True, exist_ok=True)
+    names = names or list(manifest)
+
+    def setup(name):
+        try:
+            setup_model(name, models_dir, manifest)
+            return None
+        except Exception as e:
+            print(f"Échec de la configuration de {name}: {str(e)}")
+            return name
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return [name for name in pool.map(setup, names) if name is not None]
+
+def verify_models(models_dir=MODELS_DIR, manifest=MODELS, check_hashes=False):
+    """Vérifie que tous les modèles sont présents (et intègres avec check_hashes)"""
     missing_models = []
-    
-    for model_info in MODELS.values():
-        if not (MODELS_DIR / model_info["local_name"]).exists():
+
+    for model_info in manifest.values():
+        path = Path(models_dir) / model_info["local_name"]
+        if not path.exists():
             missing_models.append(model_info["local_name"])
-    
+        elif check_hashes:
+            expected = expected_checksum(model_info, models_dir)
+            if expected is not None and sha256_file(path).hexdigest() != expected:
+                missing_models.append(model_info["local_name"])
+
     return missing_models
 
 if __name__ == "__main__":
-    print("Configuration des modèles...")
-    setup_models()
+    parser = argparse.ArgumentParser(description="Télécharge et vérifie les modèles")
+    parser.add_argument("names", nargs="*", help=f"Modèles ({', '.join(MODELS)}), tous par défaut")
+    parser.add_argument("--workers", type=int, default=DOWNLOAD_WORKERS)
+    parser.add_argument("--verify", action="store_true", help="Vérifier les empreintes SHA-256 des modèles présents")
+    args = parser.parse_args()
+
+    if args.verify:
+        invalid = verify_models(check_hashes=True)
+        print("Modèles manquants ou corrompus: " + ", ".join(invalid) if invalid else "Tous les modèles sont valides")
+    else:
+        print("Configuration des modèles...")
+        failed = setup_models(args.names or None, workers=args.workers)
+        if failed:
+            print(f"Échec: {', '.join(failed)}")
@@ -0,0 +1,107 @@
+import argparse
+import torch
+
+from backends import EXPORT_DIR, exported_path
+from image_processor import DEPTH_TIERS, U2NET_SIZE, load_midas_model
+from models.u2net import load_u2net
+from models.modnet import load_modnet
+
+# Taille d'entrée utilisée pour tracer MODNet
+MODNET_SIZE = 512
+
+class MattingExport(torch.nn.Module):
+    """N'exporte que le matte de MODNet (les autres sorties valent None en inférence)"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        return self.model(x, True)[2]
+
+def export_targets(names=None):
+    """(nom, chargeur, taille d'entrée) de chaque modèle exportable"""
+    targets = [("u2net", load_u2net, U2NET_SIZE)]
+    for model_type, resolution in DEPTH_TIERS.values():
+        if model_type is not None:
+            targets.append((model_type, lambda t=model_type: load_midas_model(t), resolution))
+    targets.append(("modnet", lambda: MattingExport(load_modnet()), MODNET_SIZE))
+    return [target for target in targets if not names or target[0] in names]
+
+def export_torchscript(name, model, example, int8):
+    """Trace le modèle en TorchScript (quantification dynamique INT8 des couches linéaires en option)
+    
+    La quantification dynamique de PyTorch ne porte que sur les couches linéaires: un modèle
+    purement convolutif (U²-Net, MiDaS small, MODNet) n'a pas de version INT8 TorchScript et
+    retourne None (ONNX Runtime quantifie aussi les convolutions).
+    """
+    if int8:
+        if not any(isinstance(module, torch.nn.Linear) for module in model.modules()):
+            return None
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    path = exported_path(name, "torchscript", int8)
+    traced = torch.jit.trace(model, example, strict=False, check_trace=False)
+    traced.save(str(path))
+    return path
+
+def export_onnx(name, model, example, int8):
+    """Exporte le modèle en ONNX (quantification dynamique INT8 via ONNX Runtime en option)"""
+    path = exported_path(name, "onnxruntime")
+    torch.onnx.export(
+        model,
+        example,
+        str(path),
+        input_names=["input"],
+        dynamic_axes={"input": {0: "batch", 2: "height", 3: "width"}},
+        opset_version=17
+    )
+    if int8:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        int8_path = exported_path(name, "onnxruntime", True)
+        quantize_dynamic(str(path), str(int8_path), weight_type=QuantType.QInt8)
+        path = int8_path
+    return path
+
+EXPORTERS = {
+    "torchscript": export_torchscript,
+    "onnxruntime": export_onnx
+}
+
+def export_models(names=None, formats=tuple(EXPORTERS), int8=False):
+    """Exporte les modèles disponibles; retourne la liste des modèles en échec"""
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    failed = []
+
+    for name, loader, size in export_targets(names):
+        try:
+            model = loader()
+            model.cpu().eval()
+        except Exception as e:
+            print(f"Chargement de {name} impossible: {str(e)}")
+            failed.append(name)
+            continue
+
+        example = torch.rand(1, 3, size, size)
+        for backend in formats:
+            try:
+                with torch.no_grad():
+                    path = EXPORTERS[backend](name, model, example, int8)
+                if path is None:
+                    print(f"{name}: aucune couche quantifiable en INT8 ({backend}), export ignoré")
+                    continue
+                print(f"{name} exporté ({backend}): {path}")
+            except Exception as e:
+                print(f"Échec de l'export de {name} ({backend}): {str(e)}")
+                failed.append(name)
+
+    return failed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporte U²-Net, MiDaS et MODNet en TorchScript / ONNX")
+    parser.add_argument("models", nargs="*", help="Modèles à exporter (tous par défaut)")
+    parser.add_argument("--format", nargs="+", choices=sorted(EXPORTERS), default=sorted(EXPORTERS))
+    parser.add_argument("--int8", action="store_true", help="Quantification dynamique INT8")
+    options = parser.parse_args()
+
+    print("Export des modèles...")
+    export_models(options.models, options.format, options.int8)
@@ -1,88 +1,383 @@
 import cv2
 import numpy as np
+import os
 import json
 import sys
+import time
 import base64
-import torch
-from scipy.spatial import cKDTree
-from scipy import ndimage
+import signal
+import argparse
+import threading
+import socketserver
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait
 from pathlib import Path
-
-# Import des modèles IA
-from models.u2net import load_u2net
-from models.midas import load_midas, estimate_depth as midas_estimate_depth
-from models.modnet import load_modnet
+import profiling
+from cache import ArrayCache
+from pipeline import run_pipeline
+from backends import load_backend
+from workers import WorkerPool
 
 # Chargement des modèles (lazy loading)
 _u2net_model = None
-_midas_model = None
+_midas_models = {}
 _modnet_model = None
 
+# Niveaux de qualité de la profondeur: modèle MiDaS et résolution native d'inférence
+# ("gradient" n'utilise aucun modèle)
+DEPTH_TIERS = {
+    "full": ("dpt_beit_large_512", 512),
+    "hybrid": ("dpt_hybrid_384", 384),
+    "fast": ("midas_v21_small_256", 256),
+    "gradient": (None, None)
+}
+DEFAULT_MIDAS_MODEL = "dpt_beit_large_512"
+
+# L'analyse de style ne garde que la profondeur moyenne: modèle léger à basse résolution
+ANALYSIS_DEPTH_QUALITY = "fast"
+ANALYSIS_DEPTH_SIZE = 128
+# Direction de la lumière: gradients de Sobel calculés par bandes de LIGHT_STRIP_ROWS lignes
+# (mémoire bornée à quelques bandes float64, quelle que soit la taille de la scène)
+LIGHT_STRIP_ROWS = 256
+
+# Recherche d'emplacement: carte de coût réduite à PLACEMENT_SIDE pixels (plus grand côté)
+PLACEMENT_SIDE = 256
+# Placement du produit par integrate_product: "center" (historique) ou "auto" (moteur de placement)
+PLACEMENT = os.environ.get("IMAGE_PLACEMENT", "center")
+
+# Format des artefacts d'analyse de scène (.npz): à incrémenter si leur contenu change
+ARTIFACT_VERSION = 1
+
+# Versions des résultats mis en cache: à incrémenter si les poids ou le post-traitement changent
+U2NET_VERSION = "U2NET-3"
+MODNET_VERSION = "1"
+MIDAS_VERSION = "1"
+
+# Cache disque des masques et cartes de profondeur, partagé entre workers
+_cache = ArrayCache()
+
+# Verrou pour éviter un double chargement quand plusieurs requêtes arrivent en parallèle (mode serve)
+_model_lock = threading.Lock()
+
+# Modèles IA: importés au premier usage, pour que les commandes sans modèle
+# (profondeur "gradient", GrabCut, encodage...) ne chargent ni torch ni les modèles
+def load_u2net():
+    from models.u2net import load_u2net
+    return load_u2net()
+
+def load_modnet():
+    from models.modnet import load_modnet
+    return load_modnet()
+
+def midas_estimate_depth(model, image):
+    from models.midas import estimate_depth
+    return estimate_depth(model, image)
+
+def load_midas_model(model_type=DEFAULT_MIDAS_MODEL):
+    """Charge le modèle MiDaS PyTorch d'origine pour un type donné
+    
+    Contrat attendu de models/midas.py: load_midas() charge DEFAULT_MIDAS_MODEL et
+    load_midas(model_type) les autres niveaux de DEPTH_TIERS (poids models/<model_type>.pt).
+    """
+    import inspect
+    from models.midas import load_midas
+    if model_type == DEFAULT_MIDAS_MODEL:
+        return load_midas()
+    if not inspect.signature(load_midas).parameters:
+        raise RuntimeError(f"models.midas.load_midas n'accepte pas de type de modèle: {model_type} indisponible")
+    return load_midas(model_type)
+
+# Les get_* utilisent le backend choisi par IMAGE_BACKEND (torch, torchscript, onnxruntime)
 def get_u2net():
     global _u2net_model
     if _u2net_model is None:
-        _u2net_model = load_u2net()
+        with _model_lock:
+            if _u2net_model is None:
+                with profiling.stage("load_u2net"):
+                    _u2net_model = load_backend("u2net", load_u2net)
     return _u2net_model
 
-def get_midas():
-    global _midas_model
-    if _midas_model is None:
-        _midas_model = load_midas()
-    return _midas_model
+def get_midas(model_type=DEFAULT_MIDAS_MODEL):
+    if model_type not in _midas_models:
+        with _model_lock:
+            if model_type not in _midas_models:
+                with profiling.stage(f"load_{model_type}"):
+                    _midas_models[model_type] = load_backend(model_type, lambda: load_midas_model(model_type))
+    return _midas_models[model_type]
 
 def get_modnet():
     global _modnet_model
     if _modnet_model is None:
-        _modnet_model = load_modnet()
+        with _model_lock:
+            if _modnet_model is None:
+                with profiling.stage("load_modnet"):
+                    _modnet_model = load_backend("modnet", load_modnet)
     return _modnet_model
 
-def remove_background_u2net(image_path):
-    """Suppression de l'arrière-plan avec U²-Net (alternative à GrabCut)"""
-    img = cv2.imread(image_path)
+def fit_size(width, height, max_side):
+    """Taille (largeur, hauteur) réduite pour que le plus grand côté ne dépasse pas max_side"""
+    scale = min(1.0, max_side / max(width, height))
+    return max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+
+# Encodage des sorties (surchargeable par requête via encoding): le format suit l'extension.
+# Sans niveau PNG, OpenCV garde son réglage par défaut (niveau 1, stratégie RLE), le plus rapide.
+ENCODING = {
+    "png_compression": os.environ.get("IMAGE_PNG_COMPRESSION"),      # 0 (rapide) à 9 (compact)
+    "webp_quality": os.environ.get("IMAGE_WEBP_QUALITY", "90"),      # 1 à 100, >100 sans perte
+    "jpeg_quality": os.environ.get("IMAGE_JPEG_QUALITY", "95")
+}
+ENCODE_FLAGS = {
+    ".png": ("png_compression", cv2.IMWRITE_PNG_COMPRESSION),
+    ".webp": ("webp_quality", cv2.IMWRITE_WEBP_QUALITY),
+    ".jpg": ("jpeg_quality", cv2.IMWRITE_JPEG_QUALITY),
+    ".jpeg": ("jpeg_quality", cv2.IMWRITE_JPEG_QUALITY)
+}
+
+def encode_params(extension, encoding=None):
+    """Paramètres cv2.imwrite / cv2.imencode pour une extension (".png", ".webp"...)"""
+    options = {**ENCODING, **(encoding or {})}
+    option, flag = ENCODE_FLAGS.get(extension.lower(), (None, None))
+    if option is None or options.get(option) is None:
+        return []
+    return [flag, int(options[option])]
+
+def write_image(path, img, encoding=None):
+    """Encode et écrit une image"""
+    with profiling.stage("encode"):
+        if not cv2.imwrite(str(path), img, encode_params(Path(path).suffix, encoding)):
+            raise Exception(f"Impossible d'écrire l'image: {path}")
+
+def decode_image(data):
+    """Décode une image encodée (PNG, JPEG, WebP...) depuis des octets, sans fichier"""
+    with profiling.stage("decode"):
+        img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
     if img is None:
-        raise Exception(f"Impossible de charger l'image: {image_path}")
+        raise Exception("Impossible de décoder l'image reçue")
+    return img
+
+def encode_image(img, format="png", encoding=None):
+    """Encode une image en octets au format donné (png, webp, jpg)"""
+    extension = f".{format.lstrip('.')}"
+    with profiling.stage("encode"):
+        ok, data = cv2.imencode(extension, img, encode_params(extension, encoding))
+    if not ok:
+        raise Exception(f"Impossible d'encoder l'image en {format}")
+    return data.tobytes()
+
+def attach_frame(spec, shape=None):
+    """Ouvre le segment de mémoire partagée {"shm": nom, "shape": [h, w, c]} d'un client
+    
+    Retourne (segment, tableau) sans copie; le segment appartient au client, qui le crée et le
+    supprime: il n'est pas suivi par le resource_tracker de ce processus.
+    """
+    try:
+        shm = shared_memory.SharedMemory(name=spec["shm"], track=False)
+    except TypeError:  # Python < 3.13: pas d'option track
+        shm = shared_memory.SharedMemory(name=spec["shm"])
+        resource_tracker.unregister(shm._name, "shared_memory")
     
-    # Redimensionner pour U²-Net
-    size = 320
+    shape = tuple(shape or spec["shape"])
+    dtype = np.dtype(spec.get("dtype", "uint8"))
+    if int(np.prod(shape)) * dtype.itemsize > shm.size:
+        shm.close()
+        raise Exception(f"Segment de mémoire partagée trop petit pour une image {shape}: {spec['shm']}")
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+def load_image(image):
+    """Retourne l'image décodée
+    
+    Accepte une image déjà chargée (évite un second décodage), un chemin, des octets encodés,
+    {"base64": ...} (image encodée) ou {"shm": nom, "shape": [h, w, 3]} (pixels BGR en mémoire partagée).
+    """
+    if isinstance(image, np.ndarray):
+        return image
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return decode_image(image)
+    if isinstance(image, dict):
+        if "base64" in image:
+            return decode_image(base64.b64decode(image["base64"]))
+        shm, frame = attach_frame(image)
+        try:
+            return frame.copy()
+        finally:
+            del frame
+            shm.close()
+    if str(image).endswith(".npy"):
+        # Tableau brut (BGR uint8) mappé en lecture seule: les très grandes scènes ne sont pas chargées d'un bloc
+        return np.load(str(image), mmap_mode="r")
+    with profiling.stage("decode"):
+        img = cv2.imread(str(image))
+    if img is None:
+        raise Exception(f"Impossible de charger l'image: {image}")
+    return img
+
+def remove_background_u2net(image):
+    """Suppression de l'arrière-plan avec U²-Net (alternative à GrabCut)"""
+    img = load_image(image)
+    
+    # Réutiliser le masque si ce produit a déjà été détouré
+    cache_key = ArrayCache.make_key(img, "u2net", U2NET_VERSION)
+    mask = _cache.get(cache_key)
+    if mask is None:
+        mask = u2net_mask(img)
+        _cache.put(cache_key, mask)
+    
+    # Créer l'image RGBA
+    rgba = cv2.cvtColor(img, cv2.COLOR_BGR2BGRA)
+    rgba[:, :, 3] = mask
+    
+    return rgba
+
+@profiling.timed("u2net")
+def u2net_mask(img):
+    """Calcule le masque alpha U²-Net à la taille de l'image"""
+    pred, = u2net_predict([img])
+    
+    # Revenir à la taille originale en suivant les contours de l'image
+    return refine_u2net_mask(img, pred)
+
+# Taille d'entrée carrée attendue par U²-Net pour l'inférence par lots
+U2NET_SIZE = 320
+
+# Résolution de travail (plus grand côté) du filtre guidé rapide qui affine les masques U²-Net
+U2NET_REFINE_SIDE = 1024
+U2NET_REFINE_EPS = 1e-3
+
+def refine_u2net_mask(img, pred):
+    """Masque uint8 pleine résolution à partir de la carte de probabilité basse résolution de U²-Net
+    
+    Filtre guidé rapide: les coefficients sont calculés à U2NET_REFINE_SIDE pixels au plus,
+    puis appliqués à l'image pleine résolution; le coût reste linéaire en nombre de pixels.
+    """
+    with profiling.stage("u2net_refine"):
+        height, width = img.shape[:2]
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        guide = np.multiply(gray, 1 / 255, dtype=np.float32)
+        
+        work_size = fit_size(width, height, U2NET_REFINE_SIDE)
+        guide_low = cv2.resize(guide, work_size, interpolation=cv2.INTER_AREA)
+        pred_low = cv2.resize(pred.astype(np.float32), work_size, interpolation=cv2.INTER_LINEAR)
+        
+        # Rayon de l'ordre d'un pixel de la carte U²-Net, dont les bords sont en escalier
+        radius = 2 * int(np.ceil(max(work_size) / max(pred.shape[:2])))
+        a, b = guided_coefficients(guide_low, pred_low, radius, U2NET_REFINE_EPS)
+        
+        # q = a * I + b en pleine résolution, en place pour limiter la mémoire (4K/8K)
+        alpha = cv2.resize(a, (width, height), interpolation=cv2.INTER_LINEAR)
+        alpha *= guide
+        alpha += cv2.resize(b, (width, height), interpolation=cv2.INTER_LINEAR)
+        return cv2.convertScaleAbs(alpha, alpha=255)
+
+def letterbox(img, size=U2NET_SIZE):
+    """Redimensionne en conservant les proportions puis complète en un carré size×size"""
     h, w = img.shape[:2]
-    aspect_ratio = w / h
-    if aspect_ratio > 1:
-        new_w = size
-        new_h = int(size / aspect_ratio)
-    else:
-        new_h = size
-        new_w = int(size * aspect_ratio)
+    scale = size / max(h, w)
+    new_w = max(1, int(round(w * scale)))
+    new_h = max(1, int(round(h * scale)))
     
-    resized = cv2.resize(img, (new_w, new_h))
+    canvas = np.zeros((size, size, 3), dtype=np.uint8)
+    top = (size - new_h) // 2
+    left = (size - new_w) // 2
+    canvas[top:top+new_h, left:left+new_w] = cv2.resize(img, (new_w, new_h))
     
-    # Préparer l'image pour U²-Net
-    tensor = torch.from_numpy(resized).float().permute(2, 0, 1)
-    tensor = tensor.unsqueeze(0) / 255.0
+    return canvas, (top, left, new_h, new_w)
+
+def u2net_predict(images):
+    """Cartes de probabilité U²-Net basse résolution, en une passe pour toutes les images
     
-    if torch.cuda.is_available():
-        tensor = tensor.cuda()
+    Même prétraitement (letterbox) pour une image seule et pour un lot: les masques mis en
+    cache sous la même clé sont identiques quel que soit le chemin.
+    """
+    import torch
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    boxes = []
+    inputs = []
+    for img in images:
+        tensor_img, box = letterbox(img)
+        inputs.append(tensor_img)
+        boxes.append(box)
+    tensor = torch.from_numpy(np.stack(inputs)).to(device)
+    tensor = tensor.permute(0, 3, 1, 2).float() / 255.0
     
-    # Prédiction avec U²-Net
     model = get_u2net()
     with torch.no_grad():
         d0, *_ = model(tensor)
-        pred = d0.squeeze()
-        if torch.cuda.is_available():
-            pred = pred.cpu()
-        pred = pred.numpy()
+        preds = d0[:, 0].cpu().numpy()
     
-    # Redimensionner le masque à la taille originale
-    mask = cv2.resize(pred, (w, h))
+    # Retirer le letterbox
+    return [pred[top:top+new_h, left:left+new_w] for pred, (top, left, new_h, new_w) in zip(preds, boxes)]
+
+def remove_background_batch(paths, batch_size=8, output_dir=None, encoding=None, output_format="png"):
+    """Suppression d'arrière-plan U²-Net par lots
     
-    # Appliquer un seuil et adoucir les bords
-    mask = (mask * 255).astype(np.uint8)
-    mask = cv2.GaussianBlur(mask, (5, 5), 0)
+    Générateur: produit un résultat par image, avec l'image RGBA (ou le chemin de l'image
+    écrite si output_dir est fourni) et les temps par étape. Le décodage des lots suivants
+    et l'encodage des précédents se font dans un pool de threads pendant l'inférence.
+    """
+    if output_dir is not None:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
     
-    # Créer l'image RGBA
-    rgba = cv2.cvtColor(img, cv2.COLOR_BGR2BGRA)
-    rgba[:, :, 3] = mask
+    def decode(path):
+        t0 = time.perf_counter()
+        try:
+            img = load_image(path)
+        except Exception as e:
+            return {"success": False, "path": str(path), "error": str(e)}
+        cache_key = ArrayCache.make_key(img, "u2net", U2NET_VERSION)
+        mask = _cache.get(cache_key)
+        return {
+            "success": True,
+            "path": str(path),
+            "image": img,
+            "cache_key": cache_key,
+            "mask": mask,
+            "cached": mask is not None,
+            "timings": {"decode_ms": (time.perf_counter() - t0) * 1000}
+        }
     
-    return rgba
+    def process(batch):
+        # Une seule passe du modèle pour toutes les images absentes du cache
+        pending = [item for item in batch if item["success"] and item["mask"] is None]
+        if pending:
+            # Chargement du modèle hors de la mesure d'inférence
+            get_u2net()
+            t0 = time.perf_counter()
+            with profiling.stage("u2net_batch"):
+                preds = u2net_predict([item["image"] for item in pending])
+            inference_ms = (time.perf_counter() - t0) * 1000 / len(pending)
+            
+            for item, pred in zip(pending, preds):
+                t0 = time.perf_counter()
+                # Revenir à la taille originale
+                item["mask"] = refine_u2net_mask(item["image"], pred)
+                _cache.put(item["cache_key"], item["mask"])
+                
+                item["timings"]["inference_ms"] = inference_ms
+                item["timings"]["postprocess_ms"] = (time.perf_counter() - t0) * 1000
+        return batch
+    
+    def encode(item):
+        if not item["success"]:
+            return item
+        rgba = cv2.cvtColor(item["image"], cv2.COLOR_BGR2BGRA)
+        rgba[:, :, 3] = item["mask"]
+        
+        timings = item["timings"]
+        result = {"success": True, "path": item["path"], "cached": item["cached"], "timings": timings}
+        
+        if output_dir is not None:
+            t0 = time.perf_counter()
+            output_path = str(Path(output_dir) / f"{Path(item['path']).stem}_no_bg.{output_format}")
+            write_image(output_path, rgba, encoding)
+            timings["encode_ms"] = (time.perf_counter() - t0) * 1000
+            result["output"] = output_path
+        else:
+            result["image"] = rgba
+        
+        return result
+    
+    yield from run_pipeline(paths, decode, process, encode, batch_size)
 
 def poisson_blend(background, foreground, mask, center):
     """Utilise cv2.seamlessClone pour une fusion naturelle"""
@@ -95,162 +390,633 @@ class SceneAnalyzer:
     
     def __init__(self, image):
         self.image = image
-        self.gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         self.height, self.width = image.shape[:2]
+        # Résultats intermédiaires mémorisés pour toute la durée de la requête
+        self._gray = None
+        self._lab = None
+        self._lab_stats = None
+        self._l_cdf = None
+        self._light_info = None
+        self._midas_depths = {}
+        self._depth_maps = {}
+        self._placement_costs = {}
+        self._artifact_depths = {}
+        self._key = None
+
+    @property
+    def key(self):
+        """Hash des pixels de la scène (vérifie qu'un artefact correspond bien à cette image)"""
+        if self._key is None:
+            self._key = ArrayCache.make_key(self.image, "scene", ARTIFACT_VERSION)
+        return self._key
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            self._gray = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
+        return self._gray
+
+    @property
+    def lab(self):
+        if self._lab is None:
+            self._lab = cv2.cvtColor(self.image, cv2.COLOR_BGR2LAB)
+        return self._lab
+
+    @property
+    def lab_stats(self):
+        """Moyenne et écart-type LAB de la scène (transfert de couleur)"""
+        if self._lab_stats is None:
+            self._lab_stats = ColorManager.lab_stats(self.lab)
+        return self._lab_stats
+
+    @property
+    def l_cdf(self):
+        """CDF du canal L, partagée par tous les produits intégrés dans cette scène"""
+        if self._l_cdf is None:
+            self._l_cdf = ColorManager.channel_cdf(self.lab[:,:,0])
+        return self._l_cdf
 
     def detect_light_direction(self):
         """Détecte la direction principale de la lumière"""
-        # Convertir en LAB pour une meilleure analyse de la luminosité
-        lab = cv2.cvtColor(self.image, cv2.COLOR_BGR2LAB)
-        l_channel = lab[:,:,0]
+        if self._light_info is not None:
+            return self._light_info
         
-        # Calculer le gradient de luminosité
-        gradient_x = cv2.Sobel(l_channel, cv2.CV_64F, 1, 0, ksize=5)
-        gradient_y = cv2.Sobel(l_channel, cv2.CV_64F, 0, 1, ksize=5)
+        # Utiliser le canal L du LAB pour une meilleure analyse de la luminosité
+        l_channel = self.lab[:,:,0]
         
-        # Calculer la direction moyenne
-        angle = np.arctan2(np.mean(gradient_y), np.mean(gradient_x))
-        magnitude = np.sqrt(np.mean(gradient_x**2) + np.mean(gradient_y**2))
+        with profiling.stage("light_direction"):
+            # Calculer le gradient de luminosité par bandes de lignes (avec 2 lignes de contexte
+            # pour le noyau 5×5): seules les sommes sont gardées, pas de gradient pleine taille
+            sums = np.zeros(4)
+            for top in range(0, self.height, LIGHT_STRIP_ROWS):
+                bottom = min(top + LIGHT_STRIP_ROWS, self.height)
+                start, end = max(top - 2, 0), min(bottom + 2, self.height)
+                strip = l_channel[start:end]
+                rows = slice(top - start, top - start + bottom - top)
+                gradient_x = cv2.Sobel(strip, cv2.CV_64F, 1, 0, ksize=5)[rows]
+                gradient_y = cv2.Sobel(strip, cv2.CV_64F, 0, 1, ksize=5)[rows]
+                sums += (gradient_x.sum(), gradient_y.sum(), np.square(gradient_x).sum(), np.square(gradient_y).sum())
+            mean_x, mean_y, mean_x2, mean_y2 = sums / (self.width * self.height)
+            
+            # Calculer la direction moyenne
+            angle = np.arctan2(mean_y, mean_x)
+            magnitude = np.sqrt(mean_x2 + mean_y2)
         
-        return {
+        self._light_info = {
             'angle': angle,
             'magnitude': magnitude,
             'direction': (np.cos(angle), np.sin(angle))
         }
+        return self._light_info
 
-    def estimate_depth(self):
-        """Estime la carte de profondeur avec MiDaS"""
-        try:
-            model = get_midas()
-            depth_map = midas_estimate_depth(model, self.image)
-            return depth_map
-        except Exception as e:
-            print(f"Erreur MiDaS, utilisation du fallback: {str(e)}")
-            # Fallback à la méthode originale si MiDaS échoue
-            blur_map = cv2.Laplacian(self.gray, cv2.CV_64F).var()
-            gradient_x = cv2.Sobel(self.gray, cv2.CV_64F, 1, 0, ksize=3)
-            gradient_y = cv2.Sobel(self.gray, cv2.CV_64F, 0, 1, ksize=3)
+    def estimate_depth(self, quality="full", size=None):
+        """Estime la carte de profondeur
+        
+        quality: "full" (MiDaS BEiT-Large), "hybrid" (DPT-Hybrid), "fast" (MiDaS small)
+        ou "gradient" (sans modèle). size: (largeur, hauteur) de la carte retournée,
+        taille de l'image par défaut.
+        """
+        size = tuple(size) if size is not None else (self.width, self.height)
+        key = (quality, size)
+        if key not in self._depth_maps:
+            self._depth_maps[key] = self._compute_depth(quality, size)
+        return self._depth_maps[key]
+
+    def _compute_depth(self, quality, size):
+        # Profondeur réduite reprise d'un artefact d'analyse
+        if quality in self._artifact_depths:
+            return cv2.resize(self._artifact_depths[quality], size, interpolation=cv2.INTER_LINEAR)
+        
+        model_type, resolution = DEPTH_TIERS[quality]
+        if model_type is not None:
+            try:
+                depth_map = self._midas_depth(model_type, resolution)
+                if depth_map.shape[:2] != (size[1], size[0]):
+                    depth_map = cv2.resize(depth_map, size)
+                return depth_map
+            except Exception as e:
+                # Repli dégradé (profondeur par gradient), pas un chemin normal: signalé et compté
+                print(f"Avertissement: MiDaS {model_type} (qualité {quality}) indisponible, "
+                      f"profondeur par gradient: {str(e)}", file=sys.stderr)
+                profiling.count("depth_fallback")
+        
+        # Fallback basé sur le gradient (aucun modèle), calculé directement à la taille demandée
+        with profiling.stage("depth_gradient"):
+            gray = self.gray
+            if size != (self.width, self.height):
+                gray = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+            gradient_x = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
+            gradient_y = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
             gradient_magnitude = np.sqrt(gradient_x**2 + gradient_y**2)
             depth_map = cv2.normalize(gradient_magnitude, None, 0, 1, cv2.NORM_MINMAX)
-            return depth_map
+        return depth_map
+
+    def _midas_depth(self, model_type, resolution):
+        """Profondeur MiDaS à la résolution native du modèle (une seule inférence par modèle)"""
+        if model_type not in self._midas_depths:
+            # Le modèle redimensionne de toute façon son entrée: inutile de lui passer l'image pleine taille
+            image = self.image
+            size = fit_size(self.width, self.height, resolution)
+            if size != (self.width, self.height):
+                image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+            
+            # Réutiliser la profondeur si cette scène a déjà été analysée
+            cache_key = ArrayCache.make_key(image, f"midas:{model_type}", MIDAS_VERSION)
+            depth_map = _cache.get(cache_key)
+            if depth_map is None:
+                model = get_midas(model_type)
+                with profiling.stage("midas"):
+                    depth_map = midas_estimate_depth(model, image)
+                _cache.put(cache_key, depth_map)
+            self._midas_depths[model_type] = depth_map
+        return self._midas_depths[model_type]
+
+    def placement_cost(self, depth_quality="fast"):
+        """Carte de coût réduite (contours + profondeur normalisée): faible là où le produit gêne peu"""
+        if depth_quality not in self._placement_costs:
+            size = fit_size(self.width, self.height, PLACEMENT_SIDE)
+            gray = cv2.resize(self.gray, size, interpolation=cv2.INTER_AREA)
+            edges = cv2.Canny(gray, 100, 200).astype(np.float32) / 255
+            depth_map = cv2.normalize(self.estimate_depth(depth_quality, size), None, 0, 1, cv2.NORM_MINMAX)
+            self._placement_costs[depth_quality] = edges + depth_map.astype(np.float32)
+        return self._placement_costs[depth_quality]
+
+    def find_placements(self, product_size, k=3, depth_quality="fast"):
+        """Les k meilleurs emplacements sans recouvrement pour un produit de taille (largeur, hauteur)
+        
+        Le coût moyen de toutes les fenêtres de la taille du produit est obtenu en une passe avec
+        une image intégrale, sur la carte réduite: le coût ne dépend pas de la taille de la scène.
+        Retourne des boîtes {x, y, width, height, cost} en pixels de la scène, triées par coût.
+        """
+        cost = self.placement_cost(depth_quality)
+        small_h, small_w = cost.shape
+        scale = small_w / self.width
+        window_w = min(small_w, max(1, int(round(product_size[0] * scale))))
+        window_h = min(small_h, max(1, int(round(product_size[1] * scale))))
+        
+        # Somme de chaque fenêtre par image intégrale, puis coût moyen
+        integral = cv2.integral(cost)
+        sums = (integral[window_h:, window_w:] - integral[:-window_h, window_w:]
+                - integral[window_h:, :-window_w] + integral[:-window_h, :-window_w])
+        means = (sums / (window_w * window_h)).astype(np.float32)
+        
+        # Toutes les fenêtres, de la moins coûteuse à la plus coûteuse
+        order = np.argsort(means, axis=None, kind="stable")
+        ys, xs = np.unravel_index(order, means.shape)
+        
+        # Sélection gloutonne: chaque boîte retenue écarte les candidats qui la recouvrent
+        boxes = []
+        while len(xs) and len(boxes) < k:
+            x, y = xs[0], ys[0]
+            boxes.append({
+                "x": min(int(round(x / scale)), self.width - product_size[0]) if product_size[0] <= self.width else 0,
+                "y": min(int(round(y / scale)), self.height - product_size[1]) if product_size[1] <= self.height else 0,
+                "width": int(product_size[0]),
+                "height": int(product_size[1]),
+                "cost": float(means[y, x])
+            })
+            keep = (np.abs(xs - x) >= window_w) | (np.abs(ys - y) >= window_h)
+            xs, ys = xs[keep], ys[keep]
+        return boxes
 
-    def find_optimal_placement(self):
-        """Trouve le meilleur emplacement pour le produit"""
-        # Créer une carte de chaleur basée sur plusieurs facteurs
-        depth_map = self.estimate_depth()
-        edges = cv2.Canny(self.image, 100, 200)
+    def save_artifact(self, path, values, depth_quality=ANALYSIS_DEPTH_QUALITY):
+        """Enregistre ce que l'analyse a calculé (.npz compressé) pour qu'un process ultérieur le réutilise
         
-        # Éviter les bords et les zones trop complexes
-        heatmap = np.zeros((self.height, self.width), dtype=np.float32)
-        heatmap += cv2.GaussianBlur(edges.astype(float), (21, 21), 0)
-        heatmap += cv2.GaussianBlur(depth_map, (21, 21), 0)
+        values: valeurs du guide de style (style_guide_values). S'y ajoutent le hash de la scène,
+        les statistiques LAB et la profondeur réduite à PLACEMENT_SIDE pixels (float16).
+        """
+        lab_mean, lab_std = self.lab_stats
+        depth_map = self.estimate_depth(depth_quality, fit_size(self.width, self.height, PLACEMENT_SIDE))
+        np.savez_compressed(
+            path,
+            version=ARTIFACT_VERSION,
+            scene_key=self.key,
+            depth_quality=depth_quality,
+            depth=depth_map.astype(np.float16),
+            lab_mean=lab_mean,
+            lab_std=lab_std,
+            **values
+        )
+
+    def load_artifact(self, path):
+        """Reprend l'analyse d'un artefact; retourne le guide de style, ou None s'il ne correspond pas à la scène"""
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != ARTIFACT_VERSION or str(data["scene_key"]) != self.key:
+                return None
+            values = {name: data[name] for name in STYLE_VALUES}
+            self._l_cdf = values["l_cdf"]
+            self._lab_stats = (data["lab_mean"], data["lab_std"])
+            self._artifact_depths[str(data["depth_quality"])] = data["depth"].astype(np.float32)
         
-        # Normaliser
-        heatmap = cv2.normalize(heatmap, None, 0, 1, cv2.NORM_MINMAX)
+        angle, magnitude = (float(value) for value in values["light"])
+        self._light_info = {
+            'angle': angle,
+            'magnitude': magnitude,
+            'direction': (np.cos(angle), np.sin(angle))
+        }
+        return format_style_guide(values)
+
+    def find_optimal_placement(self, depth_quality="fast", product_size=None, k=1):
+        """Trouve le meilleur emplacement pour le produit
+        
+        Sans taille de produit, cherche une zone d'environ 1/16 de la scène; position est le
+        centre de la meilleure boîte, candidates les k meilleures boîtes sans recouvrement.
+        """
+        if product_size is None:
+            product_size = (max(1, self.width // 16), max(1, self.height // 16))
+        candidates = self.find_placements(product_size, k, depth_quality)
+        best = candidates[0]
+        position = (best["x"] + best["width"] // 2, best["y"] + best["height"] // 2)
         
-        # Trouver le point optimal (minimum dans la heatmap)
-        min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(heatmap)
+        heatmap = self.placement_cost(depth_quality)
+        scale = heatmap.shape[1] / self.width
+        depth_map = self.estimate_depth(depth_quality, (heatmap.shape[1], heatmap.shape[0]))
         
         return {
-            'position': min_loc,
-            'depth_value': depth_map[min_loc[1], min_loc[0]],
-            'heatmap': heatmap
+            'position': position,
+            'depth_value': float(depth_map[min(int(position[1] * scale), heatmap.shape[0] - 1), min(int(position[0] * scale), heatmap.shape[1] - 1)]),
+            'heatmap': heatmap,
+            'candidates': candidates
         }
 
 class ColorManager:
     """Gestion avancée des couleurs pour une meilleure intégration"""
     
-    def __init__(self, source_img, target_img):
+    def __init__(self, source_img, target_img, target_lab=None, source_mask=None, target_mask=None, target_stats=None):
         self.source = source_img
         self.target = target_img
-        self.source_lab = cv2.cvtColor(source_img, cv2.COLOR_BGR2LAB)
-        self.target_lab = cv2.cvtColor(target_img, cv2.COLOR_BGR2LAB)
+        # Masques (uint8, non nul = pixel pris en compte) limitant les statistiques de couleur
+        self.source_mask = source_mask
+        self.target_mask = target_mask
+        # Conversions LAB et statistiques faites seulement si une méthode en a besoin
+        self._source_lab = None
+        self._target_lab = target_lab
+        self._target_stats = target_stats
+
+    @property
+    def source_lab(self):
+        if self._source_lab is None:
+            self._source_lab = cv2.cvtColor(self.source, cv2.COLOR_BGR2LAB)
+        return self._source_lab
+
+    @property
+    def target_lab(self):
+        if self._target_lab is None:
+            self._target_lab = cv2.cvtColor(self.target, cv2.COLOR_BGR2LAB)
+        return self._target_lab
+
+    @staticmethod
+    def lab_stats(lab, mask=None):
+        """Moyenne et écart-type de chaque canal, en une passe, limités aux pixels du masque"""
+        if mask is not None and cv2.countNonZero(mask) == 0:
+            mask = None
+        mean, std = cv2.meanStdDev(lab, mask=mask)
+        return mean.ravel().astype(np.float32), std.ravel().astype(np.float32)
 
     def build_color_tree(self, colors):
         """Construit un KD-tree pour la recherche rapide des couleurs les plus proches"""
+        from scipy.spatial import cKDTree
         return cKDTree(np.array(colors))
 
-    def match_histograms(self, source_channel, target_channel):
-        """Adapte l'histogramme de la source à celui de la cible"""
-        source_hist, source_bins = np.histogram(source_channel.flatten(), 256, [0, 256])
-        target_hist, target_bins = np.histogram(target_channel.flatten(), 256, [0, 256])
-        
-        # Calculer les CDF
-        source_cdf = source_hist.cumsum()
-        target_cdf = target_hist.cumsum()
-        
-        source_cdf = source_cdf / source_cdf[-1]
-        target_cdf = target_cdf / target_cdf[-1]
+    @staticmethod
+    def channel_cdf(channel, mask=None):
+        """CDF normalisée (256 valeurs float32) d'un canal uint8, limitée aux pixels du masque"""
+        hist = cv2.calcHist([channel], [0], mask, [256], [0, 256]).ravel()
+        cdf = hist.cumsum()
+        return (cdf / max(cdf[-1], 1)).astype(np.float32)
+
+    @staticmethod
+    def histogram_lut(source_cdf, target_cdf):
+        """Table de correspondance uint8 (256 entrées) qui donne à la source l'histogramme de la cible"""
+        lut = np.interp(source_cdf, target_cdf, np.arange(256))
+        return np.clip(np.round(lut), 0, 255).astype(np.uint8)
+
+    @profiling.timed("histogram_matching")
+    def match_histograms(self, source_channel, target_channel=None, target_cdf=None, source_mask=None):
+        """Adapte l'histogramme de la source à celui de la cible
         
-        # Créer la fonction de mapping
-        interp_target_values = np.interp(source_cdf, target_cdf, target_bins[:-1])
+        La CDF de la cible peut être fournie directement (calculée une fois par scène,
+        ou reprise du guide de style) au lieu du canal cible.
+        """
+        if target_cdf is None:
+            target_cdf = self.channel_cdf(target_channel, self.target_mask)
+        source_cdf = self.channel_cdf(source_channel, source_mask)
         
-        return interp_target_values[source_channel]
+        # Appliquer la fonction de mapping via une LUT
+        return cv2.LUT(source_channel, self.histogram_lut(source_cdf, target_cdf))
 
+    @profiling.timed("color_transfer")
     def color_transfer(self):
         """Implémente le transfert de couleur de Reinhard"""
-        # Calculer moyenne et écart-type pour chaque canal LAB
-        source_mean = np.mean(self.source_lab.reshape(-1, 3), axis=0)
-        source_std = np.std(self.source_lab.reshape(-1, 3), axis=0)
-        target_mean = np.mean(self.target_lab.reshape(-1, 3), axis=0)
-        target_std = np.std(self.target_lab.reshape(-1, 3), axis=0)
+        # Calculer moyenne et écart-type pour chaque canal LAB (pixels transparents exclus)
+        source_mean, source_std = self.lab_stats(self.source_lab, self.source_mask)
+        if self._target_stats is None:
+            self._target_stats = self.lab_stats(self.target_lab, self.target_mask)
+        target_mean, target_std = self._target_stats
+        
+        # (x - ms) * st / ss + mt = x * scale + offset, pour chaque canal
+        scale = target_std / np.maximum(source_std, 1e-3)
+        offset = target_mean - source_mean * scale
+        transform = np.hstack([np.diag(scale), offset[:, None]]).astype(np.float32)
         
-        # Appliquer la transformation
-        result = np.copy(self.source_lab)
-        for i in range(3):
-            result[:,:,i] = ((result[:,:,i] - source_mean[i]) * (target_std[i] / source_std[i])) + target_mean[i]
+        # Une seule passe en float32 avec saturation à [0, 255] (pas de débordement uint8)
+        result = cv2.transform(self.source_lab, transform)
         
         # Convertir en BGR
-        result = cv2.cvtColor(result, cv2.COLOR_LAB2BGR)
-        return cv2.convertScaleAbs(result)
+        return cv2.cvtColor(result, cv2.COLOR_LAB2BGR)
 
-def remove_background_grabcut(image_path):
-    """Suppression d'arrière-plan avec GrabCut (fallback)"""
-    # Lire l'image
-    img = cv2.imread(image_path)
-    if img is None:
-        raise Exception(f"Impossible de charger l'image: {image_path}")
-    
+# GrabCut travaille sur une image réduite; seule une bande autour du contour est affinée en pleine résolution
+GRABCUT_MAX_SIDE = 512
+GRABCUT_ITERATIONS = 5
+GRABCUT_MARGIN = 10  # Marge du rectangle initial (px, pleine résolution)
+
+def guided_coefficients(guide, src, radius, eps=1e-3):
+    """Coefficients moyennés (a, b) du filtre guidé (He et al.): le résultat vaut a * guide + b"""
+    size = (2 * radius + 1, 2 * radius + 1)
+    def box(x):
+        return cv2.boxFilter(x, -1, size, borderType=cv2.BORDER_REFLECT)
+    mean_i = box(guide)
+    mean_p = box(src)
+    cov_ip = box(guide * src) - mean_i * mean_p
+    var_i = box(guide * guide) - mean_i * mean_i
+    a = cov_ip / (var_i + eps)
+    b = mean_p - a * mean_i
+    return box(a), box(b)
+
+def guided_filter(guide, src, radius, eps=1e-3):
+    """Filtre guidé: lisse src en suivant les contours de guide (float32 dans [0, 1])"""
+    a, b = guided_coefficients(guide, src, radius, eps)
+    return a * guide + b
+
+def grabcut_mask(img, margin=GRABCUT_MARGIN, iterations=GRABCUT_ITERATIONS):
+    """Masque binaire (0/1) GrabCut initialisé par un rectangle à margin pixels des bords"""
     # Appliquer un filtre bilatéral pour réduire le bruit tout en préservant les bords
     img_filtered = cv2.bilateralFilter(img, 9, 75, 75)
     
     # Créer le rectangle initial pour GrabCut
     mask = np.zeros(img.shape[:2], np.uint8)
-    rect = (10, 10, img.shape[1]-20, img.shape[0]-20)
+    rect = (margin, margin, img.shape[1] - 2 * margin, img.shape[0] - 2 * margin)
     
     # Initialiser les modèles
     bgdModel = np.zeros((1,65), np.float64)
     fgdModel = np.zeros((1,65), np.float64)
     
     # Appliquer GrabCut
-    cv2.grabCut(img_filtered, mask, rect, bgdModel, fgdModel, 5, cv2.GC_INIT_WITH_RECT)
+    cv2.grabCut(img_filtered, mask, rect, bgdModel, fgdModel, iterations, cv2.GC_INIT_WITH_RECT)
+    
+    return np.where((mask==2)|(mask==0), 0, 1).astype('uint8')
+
+def refine_mask_band(img, coarse, band):
+    """Affine un masque grossier (float32 dans [0, 1]) dans une bande de band pixels autour de son contour"""
+    binary = (coarse > 0.5).astype(np.uint8)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * band + 1, 2 * band + 1))
+    band_mask = cv2.dilate(binary, kernel) - cv2.erode(binary, kernel)
+    alpha = binary.astype(np.float32)
     
-    # Créer le masque final
-    mask2 = np.where((mask==2)|(mask==0), 0, 1).astype('uint8')
+    x, y, w, h = cv2.boundingRect(band_mask)
+    if w == 0 or h == 0:
+        return alpha
+    
+    # Filtre guidé limité au rectangle englobant la bande (avec une marge pour les filtres boîte)
+    x0, y0 = max(0, x - band), max(0, y - band)
+    x1, y1 = min(img.shape[1], x + w + band), min(img.shape[0], y + h + band)
+    guide = cv2.cvtColor(img[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY).astype(np.float32) / 255
+    refined = guided_filter(guide, coarse[y0:y1, x0:x1], band)
+    
+    inside = band_mask[y0:y1, x0:x1].astype(bool)
+    alpha[y0:y1, x0:x1][inside] = np.clip(refined[inside], 0, 1)
+    return alpha
+
+@profiling.timed("grabcut")
+def remove_background_grabcut(image):
+    """Suppression d'arrière-plan avec GrabCut (fallback)"""
+    img = load_image(image)
+    height, width = img.shape[:2]
+    size = fit_size(width, height, GRABCUT_MAX_SIDE)
+    
+    if size == (width, height):
+        alpha = grabcut_mask(img).astype(np.float32)
+    else:
+        # Segmentation à basse résolution, puis affinage des bords en pleine résolution
+        scale = size[0] / width
+        small = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+        coarse = grabcut_mask(small, max(1, round(GRABCUT_MARGIN * scale)))
+        coarse = cv2.resize(coarse.astype(np.float32), (width, height), interpolation=cv2.INTER_LINEAR)
+        alpha = refine_mask_band(img, coarse, 2 * int(np.ceil(1 / scale)))
     
     # Appliquer un flou gaussien au masque pour adoucir les bords
-    mask2 = cv2.GaussianBlur(mask2, (5,5), 0)
+    alpha = cv2.GaussianBlur(alpha, (5,5), 0)
     
     # Créer l'image RGBA
     rgba = cv2.cvtColor(img, cv2.COLOR_BGR2BGRA)
-    rgba[:, :, 3] = mask2 * 255
+    rgba[:, :, 3] = np.round(alpha * 255).astype(np.uint8)
     
     return rgba
 
-def remove_background(image_path):
-    """Suppression améliorée de l'arrière-plan avec U²-Net"""
-    try:
-        # Utiliser directement U²-Net pour de meilleurs résultats
-        return remove_background_u2net(image_path)
-    except Exception as e:
-        # En cas d'erreur, utiliser GrabCut comme fallback
-        print(f"Erreur avec U²-Net ({str(e)}), utilisation de GrabCut comme fallback...")
-        return remove_background_grabcut(image_path)
+# Routage de la segmentation: "auto" (choix d'après l'image) ou une route imposée
+SEGMENTATION_ROUTE = os.environ.get("IMAGE_SEGMENTATION_ROUTE", "auto")
+SEGMENTATION_ROUTES = ("color_key", "modnet", "u2net")
+# Classification sur une image réduite: bordure de BACKDROP_BORDER (fraction du côté)
+CLASSIFY_SIDE = 256
+BACKDROP_BORDER = 0.05
+# Fond uni: écart-type LAB de la bordure sous BACKDROP_MAX_STD sur chaque canal
+BACKDROP_MAX_STD = 6.0
+# Détourage par couleur: distance LAB minimale au fond, masque calculé à COLOR_KEY_SIDE pixels
+COLOR_KEY_TOLERANCE = 12.0
+COLOR_KEY_SIDE = 512
+# Portrait: un visage d'au moins PORTRAIT_MIN_FACE de la surface de l'image
+PORTRAIT_MIN_FACE = 0.01
+
+# Décisions et latences de chaque route, depuis le démarrage (commande segmentation-stats)
+_route_stats = {route: {"count": 0, "total_ms": 0.0} for route in SEGMENTATION_ROUTES + ("grabcut",)}
+_route_lock = threading.Lock()
+_face_detector = None
+
+def border_pixels(img, border):
+    """Pixels (N×canaux) d'une bordure de border pixels autour de l'image"""
+    return np.concatenate([
+        img[:border].reshape(-1, img.shape[2]),
+        img[-border:].reshape(-1, img.shape[2]),
+        img[border:-border, :border].reshape(-1, img.shape[2]),
+        img[border:-border, -border:].reshape(-1, img.shape[2])
+    ])
+
+def get_face_detector():
+    """Détecteur de visages Haar d'OpenCV (None si cette version d'OpenCV ne le fournit pas)"""
+    global _face_detector
+    if _face_detector is None:
+        path = Path(getattr(getattr(cv2, "data", None), "haarcascades", "")) / "haarcascade_frontalface_default.xml"
+        if hasattr(cv2, "CascadeClassifier") and path.exists():
+            _face_detector = cv2.CascadeClassifier(str(path))
+        else:
+            _face_detector = False
+    return _face_detector or None
 
-def adapt_product_colors(product_img, target_img, lighting):
+@profiling.timed("segmentation_route")
+def classify_product(img):
+    """Choisit la route de segmentation: fond uni (color_key), portrait (modnet) ou cas général (u2net)
+    
+    Retourne (route, détails). Tout se fait sur une image réduite à CLASSIFY_SIDE pixels.
+    """
+    height, width = img.shape[:2]
+    small = cv2.resize(img, fit_size(width, height, CLASSIFY_SIDE), interpolation=cv2.INTER_AREA)
+    lab = cv2.cvtColor(small, cv2.COLOR_BGR2LAB)
+    border = border_pixels(lab, max(1, int(min(small.shape[:2]) * BACKDROP_BORDER))).astype(np.float32)
+    border_std = border.std(axis=0)
+    details = {"border_std": round(float(border_std.max()), 2)}
+    
+    if border_std.max() <= BACKDROP_MAX_STD:
+        return "color_key", details
+    
+    detector = get_face_detector()
+    if detector is not None:
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        min_side = int(np.sqrt(PORTRAIT_MIN_FACE * gray.size))
+        faces = detector.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(min_side, min_side))
+        details["faces"] = len(faces)
+        if len(faces):
+            return "modnet", details
+    return "u2net", details
+
+def color_key_mask(img):
+    """Masque uint8 d'un produit sur fond uni, ou None si le fond ne s'en distingue pas assez
+    
+    Le fond est la couleur moyenne de la bordure; sont retirés les pixels proches de cette
+    couleur et reliés au bord (un reflet de la couleur du fond dans le produit est conservé).
+    Le masque binaire réduit est ramené en pleine résolution par le filtre guidé de U²-Net.
+    """
+    height, width = img.shape[:2]
+    small = cv2.resize(img, fit_size(width, height, COLOR_KEY_SIDE), interpolation=cv2.INTER_AREA)
+    lab = cv2.cvtColor(small, cv2.COLOR_BGR2LAB).astype(np.float32)
+    border = border_pixels(lab, max(1, int(min(small.shape[:2]) * BACKDROP_BORDER)))
+    
+    # La luminance compte moitié moins: les ombres douces sur le fond restent du fond
+    weights = np.array([0.5, 1.0, 1.0], dtype=np.float32)
+    distance = np.linalg.norm((lab - border.mean(axis=0)) * weights, axis=2)
+    tolerance = max(COLOR_KEY_TOLERANCE, 3 * float(np.linalg.norm(border.std(axis=0) * weights)))
+    near_key = (distance < tolerance).astype(np.uint8)
+    
+    # Fond = composantes proches de la couleur du fond qui touchent le bord
+    _, labels = cv2.connectedComponents(near_key, connectivity=4)
+    edge_labels = np.unique(np.concatenate([labels[0], labels[-1], labels[:, 0], labels[:, -1]]))
+    background = np.isin(labels, edge_labels[edge_labels > 0])
+    
+    coverage = 1 - background.mean()
+    if not 0.01 <= coverage <= 0.95:
+        return None
+    return refine_u2net_mask(img, (~background).astype(np.float32))
+
+@profiling.timed("color_key")
+def remove_background_color_key(image):
+    """Suppression d'un fond uni par sa couleur (sans modèle); None si le fond ne s'y prête pas"""
+    img = load_image(image)
+    mask = color_key_mask(img)
+    if mask is None:
+        return None
+    rgba = cv2.cvtColor(img, cv2.COLOR_BGR2BGRA)
+    rgba[:, :, 3] = mask
+    return rgba
+
+# Entrée de MODNet: petit côté ramené à MODNET_SIZE, dimensions multiples de 32
+MODNET_SIZE = 512
+
+@profiling.timed("modnet")
+def modnet_mask(img):
+    """Calcule le masque alpha MODNet (matting de portrait) à la taille de l'image"""
+    height, width = img.shape[:2]
+    scale = MODNET_SIZE / min(height, width)
+    size = (max(32, int(width * scale) // 32 * 32), max(32, int(height * scale) // 32 * 32))
+    rgb = cv2.cvtColor(cv2.resize(img, size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2RGB)
+    
+    # Normalisation dans [-1, 1] attendue par MODNet
+    import torch
+    tensor = torch.from_numpy(rgb).float().permute(2, 0, 1).unsqueeze(0) / 127.5 - 1
+    if torch.cuda.is_available():
+        tensor = tensor.cuda()
+    
+    model = get_modnet()
+    with torch.no_grad():
+        _, _, matte = model(tensor, True)
+        pred = matte[0, 0].cpu().numpy()
+    
+    return refine_u2net_mask(img, pred)
+
+def remove_background_modnet(image):
+    """Suppression de l'arrière-plan avec MODNet (portraits)"""
+    img = load_image(image)
+    
+    cache_key = ArrayCache.make_key(img, "modnet", MODNET_VERSION)
+    mask = _cache.get(cache_key)
+    if mask is None:
+        mask = modnet_mask(img)
+        _cache.put(cache_key, mask)
+    
+    rgba = cv2.cvtColor(img, cv2.COLOR_BGR2BGRA)
+    rgba[:, :, 3] = mask
+    return rgba
+
+SEGMENTERS = {
+    "color_key": remove_background_color_key,
+    "modnet": remove_background_modnet,
+    "u2net": remove_background_u2net,
+}
+
+def record_route(route, elapsed_ms):
+    """Compte une décision de routage et sa latence (profileur actif et statistiques globales)"""
+    profiling.count(f"route_{route}")
+    with _route_lock:
+        _route_stats[route]["count"] += 1
+        _route_stats[route]["total_ms"] += elapsed_ms
+
+def segmentation_stats():
+    """Nombre d'images et latence moyenne de chaque route de segmentation"""
+    with _route_lock:
+        return {
+            route: {
+                "count": stats["count"],
+                "mean_ms": round(stats["total_ms"] / stats["count"], 2) if stats["count"] else None
+            }
+            for route, stats in _route_stats.items()
+        }
+
+def remove_background(image, route=None):
+    """Suppression de l'arrière-plan, par la méthode la moins coûteuse adaptée à l'image
+    
+    route: "auto" (classify_product), "color_key", "modnet" ou "u2net"; SEGMENTATION_ROUTE
+    par défaut. Une route qui échoue (fond non uni, poids absents) passe à la suivante:
+    color_key puis U²-Net, MODNet puis U²-Net, et GrabCut en dernier recours.
+    """
+    img = load_image(image)
+    route = route or SEGMENTATION_ROUTE
+    if route == "auto":
+        route, _ = classify_product(img)
+    elif route not in SEGMENTERS:
+        raise ValueError(f"Route de segmentation inconnue: {route} (attendu: auto, {', '.join(SEGMENTATION_ROUTES)})")
+    
+    for candidate in dict.fromkeys((route, "u2net")):
+        start = time.perf_counter()
+        try:
+            result = SEGMENTERS[candidate](img)
+        except Exception as e:
+            print(f"Erreur avec la route {candidate} ({str(e)}), route suivante...", file=sys.stderr)
+            continue
+        if result is not None:
+            record_route(candidate, (time.perf_counter() - start) * 1000)
+            return result
+    
+    # En cas d'erreur, utiliser GrabCut comme fallback
+    start = time.perf_counter()
+    result = remove_background_grabcut(img)
+    record_route("grabcut", (time.perf_counter() - start) * 1000)
+    return result
+
+def adapt_product_colors(product_img, target_img, lighting, target_lab=None, target_cdf=None, target_stats=None):
     """Adaptation améliorée des couleurs avec préservation des tons importants"""
-    # Créer le gestionnaire de couleurs
-    color_manager = ColorManager(product_img[:,:,:3], target_img)  # Utiliser seulement les canaux BGR
+    # Créer le gestionnaire de couleurs (canaux BGR; les pixels transparents ne comptent pas dans les statistiques)
+    source_mask = None
+    if product_img.shape[2] == 4:
+        _, source_mask = cv2.threshold(product_img[:,:,3], 127, 255, cv2.THRESH_BINARY)
+    color_manager = ColorManager(product_img[:,:,:3], target_img, target_lab, source_mask, target_stats=target_stats)
     
     # Appliquer le transfert de couleur
     color_matched = color_manager.color_transfer()
@@ -266,10 +1032,13 @@ def adapt_product_colors(product_img, target_img, lighting):
         beta=lighting['brightness'] * 255
     )
     
-    # Adapter l'histogramme du canal L
+    # Adapter l'histogramme du canal L (CDF de la scène calculée une seule fois si fournie)
+    if target_cdf is None:
+        target_cdf = ColorManager.channel_cdf(color_manager.target_lab[:,:,0])
     l_channel = color_manager.match_histograms(
         l_channel,
-        cv2.cvtColor(target_img, cv2.COLOR_BGR2LAB)[:,:,0]
+        target_cdf=target_cdf,
+        source_mask=source_mask
     )
     
     lab_product[:,:,0] = l_channel
@@ -282,56 +1051,282 @@ def adapt_product_colors(product_img, target_img, lighting):
         return result_rgba
     return result
 
+# Au-delà de ce rayon, le flou d'une tache de lumière est calculé sur une version réduite
+LIGHTING_BLUR_MAX_RADIUS = 16
+
+def blur_light_spot(spot, radius):
+    """Flou gaussien d'une tache (noyau 2*radius+1, sigma radius/3)
+    
+    Pour les grands rayons, le flou est fait sur une version réduite puis agrandie:
+    le résultat est lisse, l'écart reste négligeable et le coût ne dépend plus du rayon.
+    """
+    if radius <= LIGHTING_BLUR_MAX_RADIUS:
+        return cv2.GaussianBlur(spot, (radius*2+1, radius*2+1), radius/3)
+    
+    factor = int(np.ceil(radius / LIGHTING_BLUR_MAX_RADIUS))
+    h, w = spot.shape
+    small = cv2.resize(spot, (max(1, w // factor), max(1, h // factor)), interpolation=cv2.INTER_AREA)
+    small_radius = radius // factor
+    small = cv2.GaussianBlur(small, (small_radius*2+1, small_radius*2+1), radius/3/factor)
+    return cv2.resize(small, (w, h), interpolation=cv2.INTER_LINEAR)
+
+def build_light_mask(spots, height, width):
+    """Accumule les taches de lumière floutées, chacune limitée à la zone que son flou peut atteindre"""
+    mask = np.zeros((height, width), dtype=np.float32)
+    for spot in spots:
+        cx = int(spot['x'] * width)
+        cy = int(spot['y'] * height)
+        radius = int(spot['radius'])
+        
+        # Disque de rayon r + flou de demi-noyau r: rien ne change au-delà de 2r (+ marge pour le bord réfléchi)
+        reach = 2 * radius + 2
+        x0, y0 = max(cx - reach, 0), max(cy - reach, 0)
+        x1, y1 = min(cx + reach + 1, width), min(cy + reach + 1, height)
+        if x0 >= x1 or y0 >= y1:
+            continue
+        
+        roi = np.zeros((y1 - y0, x1 - x0), dtype=np.float32)
+        cv2.circle(roi, (cx - x0, cy - y0), radius, 1, -1)
+        mask[y0:y1, x0:x1] += blur_light_spot(roi, radius)
+    
+    # Normaliser le masque
+    return cv2.normalize(mask, None, 0, 0.5, cv2.NORM_MINMAX)
+
+@profiling.timed("lighting")
 def apply_lighting_effects(image, lighting_info):
     """Application améliorée des effets d'éclairage"""
-    result = image.copy()
     height, width = image.shape[:2]
     
-    # Créer un masque pour les ombres et reflets
-    shadow_mask = np.zeros((height, width), dtype=np.float32)
-    highlight_mask = np.zeros((height, width), dtype=np.float32)
-    
-    # Appliquer les ombres
-    for shadow in lighting_info['shadows']:
-        center = (int(shadow['x'] * width), int(shadow['y'] * height))
-        radius = int(shadow['radius'])
-        temp_mask = np.zeros((height, width), dtype=np.float32)
-        cv2.circle(temp_mask, center, radius, 1, -1)
-        temp_mask = cv2.GaussianBlur(temp_mask, (radius*2+1, radius*2+1), radius/3)
-        shadow_mask = cv2.add(shadow_mask, temp_mask)
-    
-    # Appliquer les reflets
-    for highlight in lighting_info['highlights']:
-        center = (int(highlight['x'] * width), int(highlight['y'] * height))
-        radius = int(highlight['radius'])
-        temp_mask = np.zeros((height, width), dtype=np.float32)
-        cv2.circle(temp_mask, center, radius, 1, -1)
-        temp_mask = cv2.GaussianBlur(temp_mask, (radius*2+1, radius*2+1), radius/3)
-        highlight_mask = cv2.add(highlight_mask, temp_mask)
-    
-    # Normaliser les masques
-    shadow_mask = cv2.normalize(shadow_mask, None, 0, 0.5, cv2.NORM_MINMAX)
-    highlight_mask = cv2.normalize(highlight_mask, None, 0, 0.5, cv2.NORM_MINMAX)
-    
-    # Appliquer les effets
-    result = result.astype(np.float32)
-    for i in range(3):  # Appliquer seulement sur les canaux BGR
-        result[:,:,i] = result[:,:,i] * (1 - shadow_mask) # Ombres
-        result[:,:,i] = result[:,:,i] + (255 - result[:,:,i]) * highlight_mask # Reflets
-    
-    result = cv2.convertScaleAbs(result)
+    # Créer les masques des ombres et des reflets
+    shadow_mask = build_light_mask(lighting_info['shadows'], height, width)
+    highlight_mask = build_light_mask(lighting_info['highlights'], height, width)
+    
+    # Ombres puis reflets: c * (1 - s) * (1 - h) + 255 * h, en une passe sur les trois canaux
+    result = image[:, :, :3].astype(np.float32)
+    shadow_mask = 1 - shadow_mask
+    shadow_mask *= 1 - highlight_mask
+    highlight_mask *= 255
+    result *= shadow_mask[:, :, None]
+    result += highlight_mask[:, :, None]
     
     # Préserver le canal alpha s'il existe
+    output = np.empty_like(image)
+    output[:, :, :3] = cv2.convertScaleAbs(result)
     if image.shape[2] == 4:
-        result = cv2.cvtColor(result, cv2.COLOR_BGR2BGRA)
-        result[:,:,3] = image[:,:,3]
+        output[:, :, 3] = image[:, :, 3]
     
-    return result
+    return output
 
-def integrate_product(product_img, generated_img, style_guide):
-    """Intégration améliorée du produit dans l'image générée"""
-    # Analyser la scène
-    scene = SceneAnalyzer(generated_img)
+# Hauteur des bandes de lignes traitées à la fois par la fusion et la copie vers un tampon mappé
+BLEND_STRIP_ROWS = 256
+
+def blend_into(canvas, color, alpha, x, y):
+    """Fusionne en place color (BGR) dans canvas à la position (x, y), sur la seule zone couverte
+    
+    Alpha uint8 en virgule fixe: (fg * a + bg * (255 - a)) / 255 arrondi, calculé en uint16
+    par bandes de lignes; aucun tampon de la taille du canvas n'est alloué.
+    """
+    height, width = color.shape[:2]
+    
+    # Limiter la zone au canvas (le produit peut déborder)
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + width, canvas.shape[1]), min(y + height, canvas.shape[0])
+    if x1 <= x0 or y1 <= y0:
+        return canvas  # Produit entièrement hors du canvas
+    
+    for top in range(y0, y1, BLEND_STRIP_ROWS):
+        bottom = min(top + BLEND_STRIP_ROWS, y1)
+        roi = canvas[top:bottom, x0:x1]
+        fg = color[top - y:bottom - y, x0 - x:x1 - x]
+        a = alpha[top - y:bottom - y, x0 - x:x1 - x, None].astype(np.uint16)
+        
+        blended = fg * a
+        blended += roi * (255 - a)
+        # Division par 255 arrondie, exacte sur [0, 255 * 255]
+        blended += 128
+        blended += blended >> 8
+        blended >>= 8
+        roi[...] = blended
+    
+    return canvas
+
+# Fusion du produit: "alpha" (fusion simple) ou "poisson" (domaine du gradient, zone du produit seule)
+BLEND_MODE = os.environ.get("IMAGE_BLEND_MODE", "alpha")
+# Budget de latence approximatif de toute la fusion de Poisson (ms, 0 = pleine résolution)
+POISSON_BUDGET_MS = float(os.environ.get("IMAGE_POISSON_BUDGET_MS", "30"))
+# Modèle de coût qui traduit le budget en échelle de résolution (pixels de la zone par ms):
+# coûts fixes en pleine résolution (fusion alpha comprise) et résolution multigrille.
+# Étalonnés par "benchmark.py poisson" (un cœur, valeurs affichées à reprendre ici)
+POISSON_FIXED_PIXELS_PER_MS = float(os.environ.get("IMAGE_POISSON_FIXED_PIXELS_PER_MS", "16000"))
+POISSON_PIXELS_PER_MS = float(os.environ.get("IMAGE_POISSON_PIXELS_PER_MS", "12500"))
+# Marge autour du produit, itérations de Jacobi du niveau le plus fin (doublées à chaque niveau
+# plus grossier) et taille du niveau le plus grossier
+POISSON_MARGIN = 8
+POISSON_ITERATIONS = 4
+POISSON_COARSE_SIDE = 16
+
+_LAPLACE_KERNEL = np.array([[0, 0.25, 0], [0.25, 0, 0.25], [0, 0.25, 0]], dtype=np.float32)
+
+def blend_options(blend=None):
+    """(mode, budget en ms) à partir de "alpha", "poisson" ou {"mode": ..., "budget_ms": ...}"""
+    if isinstance(blend, dict):
+        return blend.get("mode", "poisson"), float(blend.get("budget_ms", POISSON_BUDGET_MS))
+    return blend or BLEND_MODE, POISSON_BUDGET_MS
+
+def harmonic_fill(values, known):
+    """Prolonge values (H×W×C float32) hors de known par une fonction harmonique (laplacien nul)
+    
+    Multigrille en cascade: résolution sur une pyramide réduite par 2 jusqu'à POISSON_COARSE_SIDE
+    pixels, puis de niveau en niveau vers la pleine résolution, chaque niveau partant de la
+    solution agrandie du précédent et la lissant par des itérations de Jacobi: POISSON_ITERATIONS
+    au niveau le plus fin, deux fois plus à chaque niveau plus grossier (coût total proche de
+    celui du niveau le plus fin).
+    """
+    # Pyramide: moyenne des seules valeurs connues de chaque bloc
+    levels = [(values, known.astype(np.float32))]
+    while min(levels[-1][1].shape[:2]) > 2 * POISSON_COARSE_SIDE:
+        level_values, level_known = levels[-1]
+        size = ((level_known.shape[1] + 1) // 2, (level_known.shape[0] + 1) // 2)
+        weight = cv2.resize(level_known, size, interpolation=cv2.INTER_AREA)
+        total = cv2.resize(level_values * level_known[..., None], size, interpolation=cv2.INTER_AREA)
+        total = total.reshape(size[1], size[0], -1)
+        levels.append((total / np.maximum(weight, 1e-6)[..., None], (weight > 0).astype(np.float32)))
+    
+    field = None
+    for level in reversed(range(len(levels))):
+        level_values, level_known = levels[level]
+        height, width = level_known.shape
+        # Valeurs imposées: peu de pixels (un anneau), réécrits par indices après chaque itération
+        rows, cols = np.nonzero(level_known)
+        fixed_values = level_values[rows, cols]
+        if field is None:
+            # Niveau le plus grossier: départ de la moyenne des valeurs connues, assez d'itérations pour converger
+            field = np.empty_like(level_values)
+            field[...] = fixed_values.mean(axis=0)
+            iterations = 2 * max(height, width)
+        else:
+            field = cv2.resize(field, (width, height), interpolation=cv2.INTER_LINEAR).reshape(level_values.shape)
+            iterations = min(POISSON_ITERATIONS << level, 2 * max(height, width))
+        
+        field[rows, cols] = fixed_values
+        for _ in range(iterations):
+            field = cv2.filter2D(field, -1, _LAPLACE_KERNEL, borderType=cv2.BORDER_REPLICATE).reshape(level_values.shape)
+            field[rows, cols] = fixed_values
+    return field
+
+def extend_edge_colors(color, inside, ring):
+    """Remplace les pixels de ring par la couleur moyenne des pixels de inside voisins (5×5)"""
+    # Sommes 5×5 en uint16 pour une image uint8 (25 × 255 tient sur 16 bits)
+    depth = cv2.CV_16U if color.dtype == np.uint8 else cv2.CV_32F
+    weight = cv2.boxFilter(inside, depth, (5, 5), normalize=False)
+    total = cv2.boxFilter(cv2.bitwise_and(color, color, mask=inside), depth, (5, 5), normalize=False)
+    rows, cols = np.nonzero(ring)
+    color[rows, cols] = np.round(total[rows, cols] / weight[rows, cols, None].astype(np.float32))
+
+def mask_ring(inside):
+    """Anneau de 2 pixels juste à l'extérieur du masque binaire inside"""
+    return (cv2.dilate(inside, np.ones((3, 3), np.uint8), iterations=2) > 0) & (inside == 0)
+
+def poisson_scale(shape, budget_ms):
+    """Échelle de résolution de δ pour une zone de taille shape et un budget en ms (1 = pleine résolution)
+    
+    Les coûts fixes en pleine résolution (POISSON_FIXED_PIXELS_PER_MS) sont retirés du budget;
+    le reste fixe le nombre de pixels résolus (POISSON_PIXELS_PER_MS). La zone réduite garde au
+    moins deux fois POISSON_COARSE_SIDE pixels: en dessous des coûts fixes, le budget est dépassé.
+    L'échelle retournée est l'inverse d'un entier.
+    """
+    if not budget_ms:
+        return 1.0
+    area = shape[0] * shape[1]
+    solve_ms = max(budget_ms - area / POISSON_FIXED_PIXELS_PER_MS, 0.0)
+    min_scale = min(1.0, 2 * POISSON_COARSE_SIDE / min(shape[:2]))
+    scale = float(np.clip(np.sqrt(solve_ms * POISSON_PIXELS_PER_MS / area), min_scale, 1.0))
+    # Facteur de réduction entier: la réduction INTER_AREA d'OpenCV a alors un chemin rapide
+    return 1.0 / int(np.ceil(1.0 / scale - 1e-6))
+
+@profiling.timed("poisson")
+def poisson_blend_into(canvas, color, alpha, x, y, budget_ms=None):
+    """Fusion de Poisson en place, limitée à la zone du produit plus POISSON_MARGIN pixels
+    
+    Le résultat de Poisson (gradient du produit à l'intérieur du masque, bord égal à la scène)
+    s'écrit produit + δ, où δ est harmonique et vaut scène - produit au bord du masque: une
+    correction lisse, résolue par harmonic_fill. Avec budget_ms, δ est résolu sur la zone
+    réduite à l'échelle que permet le budget (poisson_scale), puis agrandi: la durée totale
+    suit approximativement le budget. Le produit corrigé est ensuite fusionné par alpha, ce
+    qui conserve les bords doux du masque.
+    """
+    height, width = color.shape[:2]
+    # Partie du produit dans le canvas: rien à fusionner s'il est entièrement à l'extérieur
+    cx0, cy0 = max(x, 0), max(y, 0)
+    cx1, cy1 = min(x + width, canvas.shape[1]), min(y + height, canvas.shape[0])
+    if cx1 <= cx0 or cy1 <= cy0:
+        return canvas
+    x0, y0 = max(x - POISSON_MARGIN, 0), max(y - POISSON_MARGIN, 0)
+    x1 = min(x + width + POISSON_MARGIN, canvas.shape[1])
+    y1 = min(y + height + POISSON_MARGIN, canvas.shape[0])
+    
+    # Produit et masque ramenés au repère de la zone (marge comprise, parties hors scène coupées)
+    fg = np.zeros((y1 - y0, x1 - x0, 3), dtype=np.uint8)
+    a = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+    fg[cy0 - y0:cy1 - y0, cx0 - x0:cx1 - x0] = color[cy0 - y:cy1 - y, cx0 - x:cx1 - x]
+    a[cy0 - y0:cy1 - y0, cx0 - x0:cx1 - x0] = alpha[cy0 - y:cy1 - y, cx0 - x:cx1 - x]
+    
+    inside = (a > 127).astype(np.uint8)
+    if not inside.any():
+        return blend_into(canvas, fg, a, x0, y0)
+    # Le gradient n'est pris qu'à l'intérieur du masque: autour, le produit est prolongé
+    # par la couleur de son bord (ce que voient aussi les bords doux de l'alpha)
+    ring = mask_ring(inside)
+    extend_edge_colors(fg, inside, ring)
+    
+    # Échelle de travail: toute la zone, ou le nombre de pixels que permet le budget
+    scale = poisson_scale(fg.shape, budget_ms)
+    bg = canvas[y0:y1, x0:x1]
+    work_fg, work_bg, work_inside = fg, bg, inside
+    if scale < 1.0:
+        # Réduction limitée aux pixels du produit (le fond de sa photo ne déborde pas sur ses bords)
+        # Facteur entier passé par fx/fy (et non une taille): chemin rapide d'INTER_AREA
+        def reduce(image):
+            return cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        coverage = reduce(inside * 255)
+        work_inside = (coverage > 127).astype(np.uint8)
+        if not work_inside.any():
+            return blend_into(canvas, fg, a, x0, y0)
+        work_fg = reduce(cv2.bitwise_and(fg, fg, mask=inside)).astype(np.float32)
+        work_fg *= 255 / np.maximum(coverage, 1).astype(np.float32)[..., None]
+        work_bg = reduce(bg)
+    
+    # δ = scène - produit sur l'anneau qui borde le masque, harmonique ailleurs
+    if scale < 1.0:
+        ring = mask_ring(work_inside)
+        extend_edge_colors(work_fg, work_inside, ring)
+    offset = np.zeros(work_fg.shape, dtype=np.float32)
+    offset[ring] = work_bg[ring].astype(np.float32) - work_fg[ring]
+    delta = harmonic_fill(offset, ring)
+    if scale < 1.0:
+        delta = cv2.resize(delta, (fg.shape[1], fg.shape[0]), interpolation=cv2.INTER_LINEAR)
+    
+    corrected = cv2.add(fg, delta, dtype=cv2.CV_8U)
+    return blend_into(canvas, corrected, a, x0, y0)
+
+def open_memmap_canvas(image, path):
+    """Copie image par bandes dans un fichier .npy mappé en mémoire et retourne ce tampon"""
+    canvas = np.lib.format.open_memmap(str(path), mode="w+", dtype=image.dtype, shape=image.shape)
+    for top in range(0, image.shape[0], BLEND_STRIP_ROWS):
+        canvas[top:top + BLEND_STRIP_ROWS] = image[top:top + BLEND_STRIP_ROWS]
+    return canvas
+
+def integrate_product(product_img, generated_img, style_guide, scene=None, out=None, placement=None, blend=None):
+    """Intégration améliorée du produit dans l'image générée
+    
+    Le produit est fusionné dans out (une copie de generated_img par défaut); out peut être
+    generated_img lui-même ou un tampon mappé en mémoire de même taille. placement vaut
+    "center" ou "auto" (meilleure boîte de SceneAnalyzer.find_placements), PLACEMENT par défaut.
+    blend vaut "alpha", "poisson" ou {"mode": "poisson", "budget_ms": 30} (blend_options).
+    """
+    # Analyser la scène (ou réutiliser l'analyse déjà faite pour cette requête)
+    if scene is None:
+        scene = SceneAnalyzer(generated_img)
     light_info = scene.detect_light_direction()
     
     # Redimensionner le produit
@@ -341,10 +1336,15 @@ def integrate_product(product_img, generated_img, style_guide):
     resized_product = cv2.resize(product_img, (product_width, product_height))
     
     # Adapter les couleurs
+    # CDF de luminance de cette scène (jamais celle du guide de style, qui peut venir d'une
+    # autre image, comme le guide de marque); un artefact de la scène la fournit déjà calculée
     adapted_product = adapt_product_colors(
         resized_product,
         generated_img,
-        style_guide['lighting']
+        style_guide['lighting'],
+        scene.lab,
+        scene.l_cdf,
+        scene.lab_stats
     )
     
     # Appliquer les effets d'éclairage
@@ -368,68 +1368,115 @@ def integrate_product(product_img, generated_img, style_guide):
         }
     )
     
-    # Position optimale (centré horizontalement, légèrement plus bas)
-    x = (generated_img.shape[1] - product_width) // 2
-    y = int(generated_img.shape[0] * 0.5) - product_height // 2
+    if (placement or PLACEMENT) == "auto":
+        # Zone de la taille du produit où les contours et la profondeur sont les plus faibles
+        best = scene.find_placements((product_width, product_height), k=1)[0]
+        x, y = best["x"], best["y"]
+    else:
+        # Position optimale (centré horizontalement, légèrement plus bas)
+        x = (generated_img.shape[1] - product_width) // 2
+        y = int(generated_img.shape[0] * 0.5) - product_height // 2
     
-    # Créer un masque alpha pour le produit
-    alpha = product_with_effects[:,:,3] if product_with_effects.shape[2] == 4 else np.ones((product_height, product_width), dtype=np.uint8) * 255
+    with profiling.stage("blend"):
+        # Créer un masque alpha pour le produit
+        alpha = product_with_effects[:,:,3] if product_with_effects.shape[2] == 4 else np.full((product_height, product_width), 255, dtype=np.uint8)
+        
+        # Appliquer un flou gaussien au masque pour des bords plus doux
+        alpha = cv2.GaussianBlur(alpha, (5,5), 0)
+        
+        # Fusionner le produit avec le fond, en place sur la seule zone du produit
+        canvas = generated_img.copy() if out is None else out
+        mode, budget_ms = blend_options(blend)
+        if mode == "poisson":
+            poisson_blend_into(canvas, product_with_effects[:,:,:3], alpha, x, y, budget_ms)
+        elif mode == "alpha":
+            blend_into(canvas, product_with_effects[:,:,:3], alpha, x, y)
+        else:
+            raise ValueError(f"Mode de fusion inconnu: {mode} (attendu: alpha, poisson)")
     
-    # Appliquer un flou gaussien au masque pour des bords plus doux
-    alpha = cv2.GaussianBlur(alpha, (5,5), 0)
+    return canvas
+
+def composite(product_img, generated_img, style_guide=None, analyze=True, out=None, placement=None, artifact=None, blend=None):
+    """Analyse la scène et y intègre le produit en partageant les images décodées et les calculs intermédiaires
     
-    # Créer un masque pleine taille pour le produit
-    mask_full = np.zeros(generated_img.shape[:2], dtype=np.uint8)
-    mask_full[y:y+product_height, x:x+product_width] = alpha
+    artifact: artefact d'analyse de cette scène (analyze_style), qui remplace l'analyse s'il correspond.
+    """
+    scene = SceneAnalyzer(generated_img)
+    artifact_guide = scene.load_artifact(artifact) if artifact is not None else None
     
-    # Créer un canvas pour le produit
-    canvas = generated_img.copy()
+    # Pipeline de traitement
+    product_no_bg = remove_background(product_img)
+    if product_no_bg is None:
+        raise Exception("Échec de la suppression de l'arrière-plan")
     
-    # Fusionner le produit avec le fond en utilisant le masque alpha
-    alpha_norm = alpha.astype(float) / 255
-    alpha_norm = np.dstack([alpha_norm] * 3)  # Répliquer pour les 3 canaux
+    # Le style fourni complète (et remplace) celui extrait de la scène
+    if artifact_guide is not None:
+        full_style_guide = artifact_guide
+    else:
+        full_style_guide = build_style_guide(scene) if analyze else {}
+    if style_guide is not None:
+        full_style_guide.update(style_guide)
     
-    roi = canvas[y:y+product_height, x:x+product_width]
-    blended = cv2.convertScaleAbs(roi * (1 - alpha_norm) + product_with_effects[:,:,:3] * alpha_norm)
-    canvas[y:y+product_height, x:x+product_width] = blended
+    final_image = integrate_product(product_no_bg, generated_img, full_style_guide, scene, out, placement, blend)
+    return final_image, full_style_guide
+
+def composite_to_output(product, generated, output, style_guide=None, analyze=True, placement=None, encoding=None, artifact=None, blend=None):
+    """Compose et livre le résultat; retourne (champs de la réponse, guide de style complet)
     
-    return canvas
+    output est un chemin, {"format": "png"} (image encodée renvoyée en base64) ou {"shm": nom}
+    (pixels BGR écrits dans un segment de mémoire partagée du client, de la taille de la scène).
+    La scène, décodée pour cette requête, reçoit le produit en place. Une sortie .npy est un
+    tampon mappé en mémoire rempli directement (pas d'encodage, mémoire bornée pour le 8K+).
+    """
+    if isinstance(output, dict) and "shm" in output:
+        # Le produit est fusionné directement dans le segment partagé
+        shm, frame = attach_frame(output, generated.shape)
+        try:
+            for top in range(0, generated.shape[0], BLEND_STRIP_ROWS):
+                frame[top:top + BLEND_STRIP_ROWS] = generated[top:top + BLEND_STRIP_ROWS]
+            _, full_style_guide = composite(product, generated, style_guide, analyze, frame, placement, artifact, blend)
+        finally:
+            del frame
+            shm.close()
+        return {"shm": output["shm"], "shape": list(generated.shape), "dtype": "uint8"}, full_style_guide
+    
+    if isinstance(output, dict):
+        out = generated if generated.flags.writeable else None
+        final_image, full_style_guide = composite(product, generated, style_guide, analyze, out, placement, artifact, blend)
+        image_format = output.get("format", "png")
+        data = encode_image(final_image, image_format, encoding)
+        return {"image": base64.b64encode(data).decode("ascii"), "format": image_format}, full_style_guide
+    
+    if str(output).endswith(".npy"):
+        out = open_memmap_canvas(generated, output)
+    elif generated.flags.writeable:
+        out = generated
+    else:
+        out = None  # Scène mappée en lecture seule: copie
+    
+    final_image, full_style_guide = composite(product, generated, style_guide, analyze, out, placement, artifact, blend)
+    if isinstance(final_image, np.memmap):
+        final_image.flush()
+    else:
+        write_image(output, final_image, encoding)
+    return {"path": output}, full_style_guide
 
-def process_product_image(product_path, generated_path, output_path, style_guide=None):
+def process_product_image(product_path, generated_path, output_path, style_guide=None, placement=None, encoding=None, scene_artifact=None, blend=None):
     """Pipeline principal amélioré"""
     try:
-        # Charger les images
-        product = cv2.imread(product_path)
-        if product is None:
-            raise Exception(f"Impossible de charger l'image du produit: {product_path}")
-            
-        generated = cv2.imread(generated_path)
-        if generated is None:
-            raise Exception(f"Impossible de charger l'image générée: {generated_path}")
-        
-        # Pipeline de traitement
-        product_no_bg = remove_background(product_path)
-        if product_no_bg is None:
-            raise Exception("Échec de la suppression de l'arrière-plan")
-        
-        # Analyser le style si non fourni
-        if style_guide is None:
-            style_guide = json.loads(analyze_style(generated_path))
-            if not style_guide['success']:
-                raise Exception("Échec de l'analyse du style")
-            style_guide = style_guide['style_guide']
-        else:
-            style_guide = json.loads(style_guide)
+        # Charger les images (chemins, base64 ou mémoire partagée)
+        product = load_image(product_path)
+        generated = load_image(generated_path)
         
-        # Intégrer le produit dans l'image générée
-        final_image = integrate_product(product_no_bg, generated, style_guide)
+        if isinstance(style_guide, str):
+            style_guide = json.loads(style_guide)
         
-        # Sauvegarder le résultat
-        cv2.imwrite(output_path, final_image)
+        # Intégrer le produit dans l'image générée et sauvegarder le résultat
+        output, _ = composite_to_output(product, generated, output_path, style_guide, style_guide is None, placement, encoding, scene_artifact, blend)
         
         return json.dumps({
             "success": True,
-            "path": output_path
+            **output
         })
         
     except Exception as e:
@@ -438,62 +1485,24 @@ def process_product_image(product_path, generated_path, output_path, style_guide
             "error": str(e)
         })
 
-def analyze_style(image_path):
-    """Analyse améliorée du style de l'image"""
+def composite_product_image(product_path, generated_path, output_path, style_guide=None, placement=None, encoding=None, scene_artifact=None, blend=None):
+    """Analyse + intégration en un seul passage: retourne le résultat et le guide de style"""
     try:
-        img = cv2.imread(image_path)
-        if img is None:
-            raise Exception(f"Impossible de charger l'image: {image_path}")
-        
-        # Créer l'analyseur de scène
-        scene = SceneAnalyzer(img)
-        
-        # Analyser l'éclairage
-        light_info = scene.detect_light_direction()
+        product = load_image(product_path)
+        generated = load_image(generated_path)
         
-        # Convertir en LAB pour analyse des couleurs
-        lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
-        
-        # Analyser la luminosité
-        l_channel = lab[:,:,0]
-        brightness = np.mean(l_channel) / 255.0
-        contrast = np.std(l_channel) / 128.0
-        
-        # Extraire les couleurs dominantes
-        pixels = img.reshape(-1, 3)
-        pixels = np.float32(pixels)
-        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
-        K = 5
-        _, labels, centers = cv2.kmeans(pixels, K, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
-        
-        # Convertir les centres en couleurs hex
-        colors = []
-        for center in centers:
-            b, g, r = center.astype(np.uint8)
-            colors.append(f"#{r:02x}{g:02x}{b:02x}")
+        if isinstance(style_guide, str):
+            style_guide = json.loads(style_guide)
         
-        # Analyser la profondeur
-        depth_map = scene.estimate_depth()
+        output, full_style_guide = composite_to_output(
+            product, generated, output_path, style_guide,
+            placement=placement, encoding=encoding, artifact=scene_artifact, blend=blend
+        )
         
         return json.dumps({
             "success": True,
-            "style_guide": {
-                "colors": colors,
-                "lighting": {
-                    "brightness": brightness,
-                    "contrast": contrast,
-                    "direction": {
-                        "angle": float(light_info['angle']),
-                        "magnitude": float(light_info['magnitude'])
-                    },
-                    "highlights": [],  # À remplir selon l'analyse
-                    "shadows": []      # À remplir selon l'analyse
-                },
-                "composition": {
-                    "depth": np.mean(depth_map),
-                    "aspectRatio": float(img.shape[1]) / img.shape[0]
-                }
-            }
+            **output,
+            "style_guide": full_style_guide
         })
         
     except Exception as e:
@@ -502,6 +1511,499 @@ def analyze_style(image_path):
             "error": str(e)
         })
 
+# Nombre maximal de pixels utilisés pour le k-means de la palette
+PALETTE_PIXEL_BUDGET = 64 * 1024
+
+@profiling.timed("kmeans")
+def extract_palette(img, k=5, pixel_budget=PALETTE_PIXEL_BUDGET, seed=0, attempts=10):
+    """Extrait les couleurs dominantes et leur poids (part des pixels), triées par poids décroissant
+    
+    Le k-means tourne sur un échantillon aléatoire d'au plus pixel_budget pixels, ce qui
+    rend le coût indépendant de la résolution. La graine fixe rend le résultat
+    reproductible d'un appel à l'autre.
+    """
+    pixels = img.reshape(-1, 3)
+    if len(pixels) > pixel_budget:
+        rng = np.random.default_rng(seed)
+        pixels = pixels[rng.integers(0, len(pixels), pixel_budget)]
+    
+    pixels = np.float32(pixels)
+    k = min(k, len(pixels))
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
+    cv2.setRNGSeed(seed)
+    _, labels, centers = cv2.kmeans(pixels, k, None, criteria, attempts, cv2.KMEANS_PP_CENTERS)
+    
+    counts = np.bincount(labels.ravel(), minlength=k)
+    palette = []
+    for index in np.argsort(-counts):
+        b, g, r = np.clip(np.round(centers[index]), 0, 255).astype(np.uint8)
+        palette.append({
+            "color": f"#{r:02x}{g:02x}{b:02x}",
+            "weight": float(counts[index]) / len(pixels)
+        })
+    return palette
+
+# Entrées partagées par les workers du pool de composite_matrix (héritées au fork, sans copie;
+# une copie par processus: le chemin sur place, lui, passe ses entrées explicitement)
+_matrix_inputs = None
+
+def _init_matrix_worker(products, scenes):
+    global _matrix_inputs
+    _matrix_inputs = (products, scenes)
+
+def _blend_pair(product_index, scene_index, output_path, inputs=None):
+    """Intègre un produit détouré dans une scène déjà analysée
+    
+    inputs: (produits, scènes) de la requête; par défaut ceux du worker (_init_matrix_worker).
+    """
+    products, scenes = inputs or _matrix_inputs
+    scene, style_guide = scenes[scene_index]
+    t0 = time.perf_counter()
+    final_image = integrate_product(products[product_index], scene.image, style_guide, scene)
+    write_image(output_path, final_image)
+    return (time.perf_counter() - t0) * 1000
+
+def composite_matrix(products, scenes, output_dir, style_guide=None, workers=None):
+    """Intègre N produits dans M scènes
+    
+    Chaque scène est analysée une seule fois et chaque produit détouré une seule fois;
+    les N×M fusions tournent ensuite dans un pool de processus. Générateur: un résultat
+    par paire, dans l'ordre où elles se terminent.
+    """
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    
+    # Décodage des images suivantes pendant le détourage et l'analyse de la précédente
+    def decode(path):
+        try:
+            return str(path), load_image(path), None
+        except Exception as e:
+            return str(path), None, e
+    
+    def segment(items):
+        path, image, error = items[0]
+        try:
+            if error is not None:
+                raise error
+            return [(path, remove_background(image), None)]
+        except Exception as e:
+            return [(path, None, e)]
+    
+    def analyze(items):
+        path, image, error = items[0]
+        try:
+            if error is not None:
+                raise error
+            scene = SceneAnalyzer(image)
+            full_style_guide = build_style_guide(scene)
+            if style_guide is not None:
+                full_style_guide.update(style_guide)
+            # Calculer maintenant ce que toutes les fusions partagent
+            scene.detect_light_direction()
+            scene.lab_stats
+            scene.l_cdf
+            return [(path, (scene, full_style_guide), None)]
+        except Exception as e:
+            return [(path, None, e)]
+    
+    segmented = []
+    for path, image, error in run_pipeline(products, decode, segment):
+        if error is not None:
+            yield {"success": False, "product": path, "error": str(error)}
+        else:
+            segmented.append((path, image))
+    
+    analyzed = []
+    for path, analysis, error in run_pipeline(scenes, decode, analyze):
+        if error is not None:
+            yield {"success": False, "scene": path, "error": str(error)}
+        else:
+            analyzed.append((path, *analysis))
+    
+    jobs = {}
+    for i, (product_path, _) in enumerate(segmented):
+        for j, (scene_path, _, _) in enumerate(analyzed):
+            output_path = str(Path(output_dir) / f"{i}-{j}_{Path(product_path).stem}_{Path(scene_path).stem}.png")
+            jobs[(i, j)] = (product_path, scene_path, output_path)
+    
+    product_images = [image for _, image in segmented]
+    scene_inputs = [(scene, guide) for _, scene, guide in analyzed]
+    
+    def result(key, run):
+        product_path, scene_path, output_path = jobs[key]
+        try:
+            return {
+                "success": True,
+                "product": product_path,
+                "scene": scene_path,
+                "path": output_path,
+                "elapsed_ms": run()
+            }
+        except Exception as e:
+            return {"success": False, "product": product_path, "scene": scene_path, "error": str(e)}
+    
+    workers = workers or os.cpu_count() or 1
+    # Un worker de serve --workers (processus démon) ne peut pas créer de processus: les fusions
+    # y tournent sur place, sur les cœurs qui lui sont réservés
+    if workers == 1 or len(jobs) <= 1 or multiprocessing.current_process().daemon:
+        # Pas de variable globale ici: plusieurs requêtes peuvent tourner en parallèle (serve --jobs)
+        inputs = (product_images, scene_inputs)
+        for key, (_, _, output_path) in jobs.items():
+            yield result(key, lambda: _blend_pair(*key, output_path, inputs))
+        return
+    
+    # fork: les workers héritent des images et analyses sans les sérialiser
+    context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(jobs)),
+        mp_context=context,
+        initializer=_init_matrix_worker,
+        initargs=(product_images, scene_inputs)
+    ) as pool:
+        futures = {pool.submit(_blend_pair, *key, output_path): key for key, (_, _, output_path) in jobs.items()}
+        for future in as_completed(futures):
+            yield result(futures[future], future.result)
+
+# Valeurs qui définissent un guide de style (forme binaire, enregistrée dans les artefacts)
+STYLE_VALUES = ("palette_colors", "palette_weights", "brightness", "contrast", "light", "depth_mean", "aspect_ratio", "l_cdf")
+
+def style_guide_values(scene, depth_quality=ANALYSIS_DEPTH_QUALITY):
+    """Analyse une scène: valeurs brutes (tableaux NumPy) du guide de style"""
+    img = scene.image
+    
+    # Analyser l'éclairage
+    light_info = scene.detect_light_direction()
+    
+    # Analyser la luminosité
+    l_channel = scene.lab[:,:,0]
+    brightness = np.mean(l_channel) / 255.0
+    contrast = np.std(l_channel) / 128.0
+    
+    # Extraire les couleurs dominantes
+    palette = extract_palette(img)
+    
+    # Analyser la profondeur (seule la moyenne est utilisée: une carte réduite suffit)
+    depth_map = scene.estimate_depth(depth_quality, fit_size(scene.width, scene.height, ANALYSIS_DEPTH_SIZE))
+    
+    return {
+        "palette_colors": np.array([entry["color"] for entry in palette]),
+        "palette_weights": np.array([entry["weight"] for entry in palette], dtype=np.float32),
+        "brightness": np.float32(brightness),
+        "contrast": np.float32(contrast),
+        "light": np.array([light_info['angle'], light_info['magnitude']], dtype=np.float32),
+        "depth_mean": np.float32(np.mean(depth_map)),
+        "aspect_ratio": np.float32(img.shape[1] / img.shape[0]),
+        "l_cdf": scene.l_cdf
+    }
+
+def format_style_guide(values):
+    """Guide de style JSON à partir des valeurs brutes
+
+    La CDF de L n'y figure pas: elle ne sert qu'à la fusion dans cette même scène et reste
+    dans SceneAnalyzer (ou dans l'artefact d'analyse).
+    """
+    colors = [str(color) for color in values["palette_colors"]]
+    return {
+        "colors": colors,
+        "palette": [
+            {"color": color, "weight": float(weight)}
+            for color, weight in zip(colors, values["palette_weights"])
+        ],
+        "lighting": {
+            "brightness": float(values["brightness"]),
+            "contrast": float(values["contrast"]),
+            "direction": {
+                "angle": float(values["light"][0]),
+                "magnitude": float(values["light"][1])
+            },
+            "highlights": [],  # À remplir selon l'analyse
+            "shadows": []      # À remplir selon l'analyse
+        },
+        "composition": {
+            "depth": float(values["depth_mean"]),
+            "aspectRatio": float(values["aspect_ratio"])
+        }
+    }
+
+def build_style_guide(scene, depth_quality=ANALYSIS_DEPTH_QUALITY):
+    """Construit le guide de style à partir d'une scène analysée"""
+    return format_style_guide(style_guide_values(scene, depth_quality))
+
+def analyze_style(image_path, depth_quality=ANALYSIS_DEPTH_QUALITY, artifact_path=None):
+    """Analyse améliorée du style de l'image
+    
+    Avec artifact_path, enregistre aussi l'artefact d'analyse (.npz) que process et composite
+    peuvent reprendre au lieu de réanalyser la scène.
+    """
+    try:
+        img = load_image(image_path)
+        scene = SceneAnalyzer(img)
+        values = style_guide_values(scene, depth_quality)
+        
+        response = {
+            "success": True,
+            "style_guide": format_style_guide(values)
+        }
+        if artifact_path is not None:
+            scene.save_artifact(artifact_path, values, depth_quality)
+            response["artifact"] = str(artifact_path)
+        return json.dumps(response)
+        
+    except Exception as e:
+        return json.dumps({
+            "success": False,
+            "error": str(e)
+        })
+
+# Commandes disponibles en mode serve: nom -> fonction(args) retournant une réponse JSON
+COMMANDS = {
+    "analyze": lambda args: analyze_style(
+        args["image_path"],
+        args.get("depth_quality", ANALYSIS_DEPTH_QUALITY),
+        args.get("artifact_path")
+    ),
+    "process": lambda args: process_product_image(
+        args["product_path"],
+        args["generated_path"],
+        args["output_path"],
+        args.get("style_guide"),
+        args.get("placement"),
+        args.get("encoding"),
+        args.get("scene_artifact"),
+        args.get("blend")
+    ),
+    "batch-remove-bg": lambda args: json.dumps({
+        "success": True,
+        "results": list(remove_background_batch(
+            args["paths"],
+            args.get("batch_size", 8),
+            args["output_dir"],
+            args.get("encoding"),
+            args.get("format", "png")
+        ))
+    }),
+    "cache-stats": lambda args: json.dumps({"success": True, "cache": _cache.stats()}),
+    "segmentation-stats": lambda args: json.dumps({"success": True, "routes": segmentation_stats()}),
+    "composite-matrix": lambda args: json.dumps({
+        "success": True,
+        "results": list(composite_matrix(
+            args["products"],
+            args["scenes"],
+            args["output_dir"],
+            args.get("style_guide"),
+            args.get("workers")
+        ))
+    }),
+    "composite": lambda args: composite_product_image(
+        args["product_path"],
+        args["generated_path"],
+        args["output_path"],
+        args.get("style_guide"),
+        args.get("placement"),
+        args.get("encoding"),
+        args.get("scene_artifact"),
+        args.get("blend")
+    ),
+}
+
+def run_command(handler, profile=None):
+    """Exécute une commande et retourne sa réponse décodée
+    
+    Si profile est fourni (True ou {"trace": chemin, "prometheus": chemin}), la réponse
+    contient un champ timings avec les mesures de chaque étape.
+    """
+    if not profile:
+        return json.loads(handler())
+    
+    with profiling.profile() as profiler:
+        response = json.loads(handler())
+    response["timings"] = profiler.summary()
+    if isinstance(profile, dict):
+        profiler.export(profile.get("trace"), profile.get("prometheus"))
+    return response
+
+def cli_profile_options():
+    """Profilage en ligne de commande: IMAGE_PROFILE=1, IMAGE_PROFILE_TRACE et IMAGE_PROFILE_PROMETHEUS"""
+    if os.environ.get("IMAGE_PROFILE", "0") != "1":
+        return None
+    return {
+        "trace": os.environ.get("IMAGE_PROFILE_TRACE"),
+        "prometheus": os.environ.get("IMAGE_PROFILE_PROMETHEUS")
+    }
+
+def handle_request(request):
+    """Exécute une requête du mode serve et retourne la réponse (avec l'identifiant de la requête)"""
+    handler = COMMANDS.get(request.get("command"))
+    try:
+        if handler is None:
+            raise Exception(f"Commande inconnue: {request.get('command')}")
+        args = request.get("args", {})
+        response = run_command(lambda: handler(args), request.get("profile"))
+    except KeyError as e:
+        response = {"success": False, "error": f"Paramètre manquant: {str(e)}"}
+    except Exception as e:
+        response = {"success": False, "error": str(e)}
+    response["id"] = request.get("id")
+    return response
+
+class ImageProcessorServer:
+    """Serveur persistant: garde les modèles en mémoire et traite des requêtes JSON (une par ligne)"""
+
+    def __init__(self, max_jobs=2):
+        self.executor = ThreadPoolExecutor(max_workers=max_jobs)
+        self.workers = None
+        self.stopping = threading.Event()
+
+    def preload(self):
+        """Charge les modèles à l'avance pour que la première requête ne paie pas le démarrage"""
+        analysis_midas = DEPTH_TIERS[ANALYSIS_DEPTH_QUALITY][0]
+        for name, loader in (("U²-Net", get_u2net), ("MiDaS", lambda: get_midas(analysis_midas))):
+            try:
+                loader()
+            except Exception as e:
+                print(f"Préchargement de {name} impossible: {str(e)}", file=sys.stderr)
+
+    def start_workers(self, workers, threads_per_worker=None):
+        """Traite les requêtes dans des processus forkés, chacun sur ses propres cœurs
+        
+        À appeler après preload(): les workers partagent les modèles déjà chargés.
+        """
+        self.workers = WorkerPool(handle_request, workers, threads_per_worker)
+        for index, (cores, threads) in enumerate(zip(self.workers.core_sets, self.workers.threads)):
+            print(f"Worker {index}: cœurs {cores}, {threads} thread(s)", file=sys.stderr)
+
+    def submit(self, line, write):
+        """Décode une ligne JSON et planifie son traitement; la réponse est envoyée via write()
+        
+        Retourne un Future terminé une fois la réponse écrite (None si elle l'est déjà).
+        """
+        line = line.strip()
+        if not line:
+            return
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            write({"id": None, "success": False, "error": f"Requête JSON invalide: {str(e)}"})
+            return
+        
+        if request.get("command") == "shutdown":
+            self.stopping.set()
+            write({"id": request.get("id"), "success": True})
+            return
+        
+        if self.workers is not None:
+            future = self.workers.submit(request)
+        else:
+            future = self.executor.submit(handle_request, request)
+        written = Future()
+        
+        def respond(f):
+            try:
+                write(
+                    f.result() if f.exception() is None
+                    else {"id": request.get("id"), "success": False, "error": str(f.exception())}
+                )
+            finally:
+                written.set_result(None)
+        
+        future.add_done_callback(respond)
+        return written
+
+    def close(self):
+        """Arrêt propre: attend la fin des traitements en cours"""
+        self.stopping.set()
+        self.executor.shutdown(wait=True)
+        if self.workers is not None:
+            self.workers.shutdown(wait=True)
+
+    def serve_stdio(self, output=None):
+        """Lit les requêtes sur stdin et écrit les réponses sur output (stdout par défaut)"""
+        # Tout affichage (logs, fallbacks) part sur stderr pour ne pas corrompre le protocole
+        output = output or sys.stdout
+        sys.stdout = sys.stderr
+        write_lock = threading.Lock()
+        
+        def write(response):
+            with write_lock:
+                output.write(json.dumps(response) + "\n")
+                output.flush()
+        
+        try:
+            for line in sys.stdin:
+                self.submit(line, write)
+                if self.stopping.is_set():
+                    break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def serve_socket(self, socket_path):
+        """Écoute sur un socket Unix; chaque connexion peut envoyer plusieurs requêtes"""
+        server_ref = self
+        
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                write_lock = threading.Lock()
+                
+                def write(response):
+                    with write_lock:
+                        try:
+                            self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+                            self.wfile.flush()
+                        except (OSError, ValueError):
+                            pass  # Client déconnecté (ValueError: flux déjà fermé)
+                
+                futures = []
+                for line in self.rfile:
+                    future = server_ref.submit(line.decode("utf-8"), write)
+                    if future is not None:
+                        futures.append(future)
+                    if server_ref.stopping.is_set():
+                        threading.Thread(target=self.server.shutdown).start()
+                        break
+                # Un client peut fermer son côté écriture après ses requêtes: les réponses
+                # doivent partir avant que finish() ne ferme wfile
+                wait(futures)
+        
+        Path(socket_path).unlink(missing_ok=True)
+        server = socketserver.ThreadingUnixStreamServer(socket_path, Handler)
+        server.daemon_threads = True
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.close()
+            Path(socket_path).unlink(missing_ok=True)
+
+def serve(argv):
+    """Point d'entrée du mode serve"""
+    parser = argparse.ArgumentParser(prog="image_processor.py serve")
+    parser.add_argument("--socket", help="Chemin du socket Unix (stdin/stdout par défaut)")
+    parser.add_argument("--jobs", type=int, default=2, help="Nombre de requêtes traitées en parallèle")
+    parser.add_argument("--preload", action="store_true", help="Charger les modèles au démarrage")
+    parser.add_argument("--workers", type=int, help="Processus workers (forkés après le chargement des modèles)")
+    parser.add_argument("--threads-per-worker", type=int, help="Threads PyTorch/OpenCV par worker (ses cœurs par défaut)")
+    options = parser.parse_args(argv)
+    
+    server = ImageProcessorServer(max_jobs=options.jobs)
+    # SIGTERM déclenche le même arrêt propre que Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    output = None
+    if not options.socket:
+        # stdout est le canal du protocole dès le préchargement (fallbacks des modèles, workers forkés)
+        output, sys.stdout = sys.stdout, sys.stderr
+    if options.preload or options.workers:
+        server.preload()
+    if options.workers:
+        server.start_workers(options.workers, options.threads_per_worker)
+    
+    if options.socket:
+        server.serve_socket(options.socket)
+    else:
+        server.serve_stdio(output)
+
 if __name__ == "__main__":
     command = sys.argv[1]
     
@@ -509,9 +2011,67 @@ if __name__ == "__main__":
         product_path = sys.argv[3]  # Inversé l'ordre des arguments
         generated_path = sys.argv[2]
         output_path = sys.argv[4]
-        style_guide = sys.argv[5] if len(sys.argv) > 5 else None
-        print(process_product_image(product_path, generated_path, output_path, style_guide))
+        style_guide = sys.argv[5] if len(sys.argv) > 5 and sys.argv[5] else None
+        scene_artifact = sys.argv[6] if len(sys.argv) > 6 else None
+        print(json.dumps(run_command(
+            lambda: process_product_image(product_path, generated_path, output_path, style_guide, scene_artifact=scene_artifact),
+            cli_profile_options()
+        )))
+        
+    elif command == "composite":
+        generated_path = sys.argv[2]
+        product_path = sys.argv[3]
+        output_path = sys.argv[4]
+        style_guide = sys.argv[5] if len(sys.argv) > 5 and sys.argv[5] else None
+        print(json.dumps(run_command(
+            lambda: composite_product_image(product_path, generated_path, output_path, style_guide),
+            cli_profile_options()
+        )))
         
     elif command == "analyze":
         image_path = sys.argv[2]
-        print(analyze_style(image_path))
+        depth_quality = sys.argv[3] if len(sys.argv) > 3 else ANALYSIS_DEPTH_QUALITY
+        artifact_path = sys.argv[4] if len(sys.argv) > 4 else None
+        print(json.dumps(run_command(lambda: analyze_style(image_path, depth_quality, artifact_path), cli_profile_options())))
+        
+    elif command == "batch-remove-bg":
+        parser = argparse.ArgumentParser(prog="image_processor.py batch-remove-bg")
+        parser.add_argument("output_dir")
+        parser.add_argument("images", nargs="+")
+        parser.add_argument("--batch-size", type=int, default=8)
+        parser.add_argument("--format", choices=["png", "webp"], default="png")
+        parser.add_argument("--png-compression", type=int)
+        parser.add_argument("--webp-quality", type=int)
+        options = parser.parse_args(sys.argv[2:])
+        encoding = {
+            key: value
+            for key, value in (("png_compression", options.png_compression), ("webp_quality", options.webp_quality))
+            if value is not None
+        }
+        
+        # Un résultat JSON par ligne, dès que chaque image est terminée
+        try:
+            for result in remove_background_batch(options.images, options.batch_size, options.output_dir, encoding, options.format):
+                print(json.dumps(result), flush=True)
+        except Exception as e:
+            print(json.dumps({"success": False, "error": str(e)}))
+        
+    elif command == "composite-matrix":
+        parser = argparse.ArgumentParser(prog="image_processor.py composite-matrix")
+        parser.add_argument("output_dir")
+        parser.add_argument("--products", nargs="+", required=True)
+        parser.add_argument("--scenes", nargs="+", required=True)
+        parser.add_argument("--workers", type=int, help="Processus de fusion en parallèle (nombre de cœurs par défaut)")
+        parser.add_argument("--style-guide", type=json.loads)
+        options = parser.parse_args(sys.argv[2:])
+        
+        # Un résultat JSON par ligne, dès que chaque fusion est terminée
+        try:
+            for result in composite_matrix(options.products, options.scenes, options.output_dir,
+                                           options.style_guide, options.workers):
+                print(json.dumps(result), flush=True)
+        except Exception as e:
+            print(json.dumps({"success": False, "error": str(e)}))
+        
+    elif command == "serve":
+        serve(sys.argv[2:])
@@ -0,0 +1,52 @@
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+
+import profiling
+
+# Threads d'E/S (décodage/encodage: OpenCV libère le GIL) et nombre de lots préparés d'avance
+IO_WORKERS = int(os.environ.get("IMAGE_IO_WORKERS", "4"))
+PIPELINE_DEPTH = int(os.environ.get("IMAGE_PIPELINE_DEPTH", "2"))
+
+def run_pipeline(jobs, decode, process, encode=None, batch_size=1, workers=IO_WORKERS, depth=PIPELINE_DEPTH):
+    """Génère encode(résultat) pour chaque résultat de process, en recouvrant E/S et calcul
+
+    decode(job) et encode(résultat) tournent dans un pool de threads; process(éléments) reçoit
+    des lots de batch_size éléments décodés et s'exécute dans le thread appelant (inférence).
+    Pendant le calcul d'un lot, les depth lots suivants sont décodés et les résultats précédents
+    encodés. Les files sont bornées: au plus depth lots décodés d'avance et depth lots en attente
+    d'encodage. Les résultats sortent dans l'ordre des tâches.
+    """
+    jobs = iter(jobs)
+    decode = profiling.bind(decode)
+    encode = profiling.bind(encode) if encode is not None else None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        decoding = deque()
+        encoding = deque()
+
+        def prefetch():
+            batch = list(islice(jobs, batch_size))
+            if batch:
+                decoding.append([pool.submit(decode, job) for job in batch])
+
+        for _ in range(depth):
+            prefetch()
+
+        while decoding:
+            futures = decoding.popleft()
+            prefetch()
+            for result in process([future.result() for future in futures]):
+                encoding.append(pool.submit(encode, result) if encode is not None else _done(result))
+
+            while len(encoding) > depth * batch_size:
+                yield encoding.popleft().result()
+
+        while encoding:
+            yield encoding.popleft().result()
+
+def _done(value):
+    future = Future()
+    future.set_result(value)
+    return future
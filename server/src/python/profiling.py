@@ -0,0 +1,278 @@
+import os
+import json
+import time
+import threading
+import functools
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # Windows: pas de mesure du pic mémoire
+    resource = None
+
+# Profileur actif pour la requête en cours (un par thread, donc par requête en mode serve)
+_current = threading.local()
+
+# Profileurs en cours dans le processus: le pic VmHWM est commun à tous, il n'est remis à
+# zéro que si aucune autre requête n'est mesurée
+_active = set()
+_active_lock = threading.Lock()
+
+# Intervalle d'échantillonnage de la mémoire résidente pour le pic de chaque étape (ms)
+RSS_SAMPLE_MS = float(os.environ.get("IMAGE_PROFILE_RSS_SAMPLE_MS", "5"))
+
+def rss_mb():
+    """Mémoire résidente actuelle du processus (Mo), None sans /proc"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def reset_peak_rss():
+    """Remet à zéro le pic de mémoire résidente (VmHWM) du processus; False si impossible"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss_mb():
+    """Pic de mémoire résidente (Mo) depuis la dernière remise à zéro, ou depuis le démarrage"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class Profiler:
+    """Mesure le temps mural, le temps CPU et la mémoire de chaque étape d'une requête
+
+    Le temps CPU est celui du processus (il inclut les threads de calcul de PyTorch et
+    d'OpenCV); avec plusieurs requêtes simultanées, il inclut aussi leur travail. Chaque
+    étape enregistre la mémoire résidente à sa fin, sa variation (rss_delta_mb) et le pic
+    de la mémoire du processus pendant l'étape (peak_rss_mb: échantillons toutes les
+    RSS_SAMPLE_MS, complétés par VmHWM quand le pic a été dépassé pendant l'étape).
+
+    Le pic du processus (VmHWM) est remis à zéro au début de la requête quand aucune autre
+    n'est mesurée (Linux): peak_rss_mb de la requête vaut alors pour elle seule
+    (peak_rss_scope "request"). Si une autre requête mesurée la chevauche, ou sans /proc,
+    c'est le pic du processus ("process").
+    """
+
+    def __init__(self):
+        self.concurrent = False
+        with _active_lock:
+            if _active:
+                # Le pic des autres requêtes en cours ne doit pas être remis à zéro
+                self.concurrent = True
+                for other in _active:
+                    other.concurrent = True
+                self.peak_reset = False
+            else:
+                self.peak_reset = reset_peak_rss()
+            _active.add(self)
+        self.origin = time.perf_counter()
+        self.events = []
+        self.counters = {}
+        self._lock = threading.Lock()
+        # Pic de mémoire observé pour chaque étape en cours
+        self._open_stages = {}
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_rss, daemon=True)
+        self._sampler.start()
+
+    @property
+    def peak_rss_scope(self):
+        return "request" if self.peak_reset and not self.concurrent else "process"
+
+    def _sample_rss(self):
+        while not self._stopped.wait(RSS_SAMPLE_MS / 1000):
+            rss = rss_mb()
+            if rss is None:
+                return
+            with self._lock:
+                for token, peak in self._open_stages.items():
+                    if rss > peak:
+                        self._open_stages[token] = rss
+
+    def close(self):
+        """Fin de la requête: arrête l'échantillonnage"""
+        self._stopped.set()
+        with _active_lock:
+            _active.discard(self)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        rss_start = rss_mb()
+        hwm_start = peak_rss_mb()
+        token = object()
+        with self._lock:
+            self._open_stages[token] = rss_start or 0.0
+        try:
+            yield
+        finally:
+            rss_end = rss_mb()
+            hwm_end = peak_rss_mb()
+            with self._lock:
+                peak = max(self._open_stages.pop(token), rss_end or 0.0)
+            # VmHWM dépassé pendant l'étape: le pic exact a eu lieu pendant celle-ci
+            if hwm_start is not None and hwm_end is not None and hwm_end > hwm_start:
+                peak = max(peak, hwm_end)
+            event = {
+                "name": name,
+                "start_ms": (start - self.origin) * 1000,
+                "wall_ms": (time.perf_counter() - start) * 1000,
+                "cpu_ms": (time.process_time() - cpu_start) * 1000,
+                "rss_mb": rss_end,
+                "rss_delta_mb": None if rss_end is None or rss_start is None else rss_end - rss_start,
+                "peak_rss_mb": peak or None,
+                "thread": threading.get_ident()
+            }
+            with self._lock:
+                self.events.append(event)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        """Mesures agrégées par étape, pour le champ timings des réponses JSON"""
+        stages = {}
+        for event in self.events:
+            entry = stages.setdefault(event["name"], {
+                "calls": 0, "wall_ms": 0.0, "cpu_ms": 0.0, "rss_mb": None, "rss_delta_mb": None, "peak_rss_mb": None
+            })
+            entry["calls"] += 1
+            entry["wall_ms"] += event["wall_ms"]
+            entry["cpu_ms"] += event["cpu_ms"]
+            if event["rss_mb"] is not None:
+                entry["rss_mb"] = max(entry["rss_mb"] or 0, event["rss_mb"])
+            if event["rss_delta_mb"] is not None:
+                entry["rss_delta_mb"] = (entry["rss_delta_mb"] or 0) + event["rss_delta_mb"]
+            if event["peak_rss_mb"] is not None:
+                entry["peak_rss_mb"] = max(entry["peak_rss_mb"] or 0, event["peak_rss_mb"])
+        return {
+            "total_ms": (time.perf_counter() - self.origin) * 1000,
+            "peak_rss_mb": peak_rss_mb(),
+            "peak_rss_scope": self.peak_rss_scope,
+            "stages": stages,
+            "counters": dict(self.counters)
+        }
+
+    def prometheus(self):
+        """Mesures au format texte Prometheus"""
+        summary = self.summary()
+        lines = [
+            "# TYPE image_processor_stage_seconds gauge",
+            "# TYPE image_processor_stage_cpu_seconds gauge",
+            "# TYPE image_processor_stage_calls gauge",
+            "# TYPE image_processor_stage_rss_delta_bytes gauge",
+            "# TYPE image_processor_stage_peak_rss_bytes gauge"
+        ]
+        for name, entry in summary["stages"].items():
+            lines.append(f'image_processor_stage_seconds{{stage="{name}"}} {entry["wall_ms"] / 1000:.6f}')
+            lines.append(f'image_processor_stage_cpu_seconds{{stage="{name}"}} {entry["cpu_ms"] / 1000:.6f}')
+            lines.append(f'image_processor_stage_calls{{stage="{name}"}} {entry["calls"]}')
+            if entry["rss_delta_mb"] is not None:
+                lines.append(f'image_processor_stage_rss_delta_bytes{{stage="{name}"}} {int(entry["rss_delta_mb"] * 1024 * 1024)}')
+            if entry["peak_rss_mb"] is not None:
+                lines.append(f'image_processor_stage_peak_rss_bytes{{stage="{name}"}} {int(entry["peak_rss_mb"] * 1024 * 1024)}')
+        lines.append("# TYPE image_processor_events gauge")
+        for name, value in summary["counters"].items():
+            lines.append(f'image_processor_events{{event="{name}"}} {value}')
+        if summary["peak_rss_mb"] is not None:
+            lines.append("# TYPE image_processor_peak_rss_bytes gauge")
+            lines.append(f"image_processor_peak_rss_bytes {int(summary['peak_rss_mb'] * 1024 * 1024)}")
+        return "\n".join(lines) + "\n"
+
+    def chrome_trace(self):
+        """Événements au format Chrome trace (chrome://tracing, Perfetto)"""
+        pid = os.getpid()
+        return {
+            "traceEvents": [
+                {
+                    "name": event["name"],
+                    "ph": "X",
+                    "ts": event["start_ms"] * 1000,
+                    "dur": event["wall_ms"] * 1000,
+                    "pid": pid,
+                    "tid": event["thread"],
+                    "args": {
+                        "cpu_ms": event["cpu_ms"],
+                        "rss_mb": event["rss_mb"],
+                        "rss_delta_mb": event["rss_delta_mb"],
+                        "peak_rss_mb": event["peak_rss_mb"]
+                    }
+                }
+                for event in self.events
+            ]
+        }
+
+    def export(self, trace_path=None, prometheus_path=None):
+        """Écrit la trace Chrome et/ou le texte Prometheus si des chemins sont donnés"""
+        if trace_path:
+            with open(trace_path, "w") as f:
+                json.dump(self.chrome_trace(), f)
+        if prometheus_path:
+            with open(prometheus_path, "w") as f:
+                f.write(self.prometheus())
+
+@contextmanager
+def profile():
+    """Active un profileur pour le thread courant pendant la durée du bloc"""
+    previous = getattr(_current, "profiler", None)
+    profiler = Profiler()
+    _current.profiler = profiler
+    try:
+        yield profiler
+    finally:
+        profiler.close()
+        _current.profiler = previous
+
+def stage(name):
+    """Mesure une étape si un profileur est actif (sans coût sinon)"""
+    profiler = getattr(_current, "profiler", None)
+    if profiler is None:
+        return nullcontext()
+    return profiler.stage(name)
+
+def timed(name):
+    """Décorateur: mesure chaque appel de la fonction comme une étape"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def bind(func):
+    """Retourne func exécutée avec le profileur du thread courant (pour les pools de threads)"""
+    profiler = getattr(_current, "profiler", None)
+    if profiler is None:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        previous = getattr(_current, "profiler", None)
+        _current.profiler = profiler
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current.profiler = previous
+    return wrapper
+
+def count(name, value=1):
+    """Incrémente un compteur (hits de cache, ...) si un profileur est actif"""
+    profiler = getattr(_current, "profiler", None)
+    if profiler is not None:
+        profiler.count(name, value)
@@ -0,0 +1,81 @@
+import cv2
+import numpy as np
+
+from image_processor import blend_into, poisson_blend_into, poisson_scale
+
+def blend_case(size=100, side=30):
+    canvas = np.full((size, size, 3), 50, dtype=np.uint8)
+    color = np.full((side, side, 3), 200, dtype=np.uint8)
+    alpha = np.full((side, side), 255, dtype=np.uint8)
+    return canvas, color, alpha
+
+def test_blend_partially_outside():
+    """Seule la partie du produit qui recouvre le canvas est fusionnée"""
+    canvas, color, alpha = blend_case()
+    blend_into(canvas, color, alpha, -10, 80)
+    assert (canvas[80:, :20] == 200).all()
+    assert (canvas[:80] == 50).all() and (canvas[:, 20:] == 50).all()
+
+def test_blend_outside_canvas():
+    """Un produit entièrement hors du canvas le laisse intact"""
+    for x, y in ((-40, 10), (105, 10), (10, -40), (10, 105), (100, 100)):
+        canvas, color, alpha = blend_case()
+        blend_into(canvas, color, alpha, x, y)
+        assert (canvas == 50).all(), (x, y)
+
+def poisson_case(size=256, side=120):
+    """Scène en dégradé et produit (disque texturé sur fond uni) avec alpha aux bords doux"""
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32)
+    scene = np.dstack([x * 0.6 + 40, y * 0.5 + 60, (x + y) * 0.3 + 30]).astype(np.uint8)
+    rng = np.random.default_rng(0)
+    product = np.full((side, side, 3), 240, dtype=np.uint8)
+    cv2.circle(product, (side // 2, side // 2), side // 3, (60, 90, 170), -1)
+    product = np.clip(product + rng.normal(0, 4, product.shape), 0, 255).astype(np.uint8)
+    alpha = np.zeros((side, side), dtype=np.uint8)
+    cv2.circle(alpha, (side // 2, side // 2), side // 3, 255, -1)
+    alpha = cv2.GaussianBlur(alpha, (5, 5), 0)
+    return scene, product, alpha
+
+def test_poisson_outside_canvas():
+    """Comme blend_into, la fusion de Poisson ignore un produit entièrement hors du canvas"""
+    for x, y in ((-40, 10), (105, 10), (10, -40), (10, 105)):
+        canvas, color, alpha = blend_case()
+        poisson_blend_into(canvas, color, alpha, x, y)
+        assert (canvas == 50).all(), (x, y)
+    canvas, color, alpha = blend_case()
+    poisson_blend_into(canvas, color, alpha, -10, 80)
+    assert (canvas[:70] == 50).all()
+
+def test_poisson_scale():
+    """Pleine résolution sans budget, échelle croissante avec le budget, facteurs entiers"""
+    shape = (1000, 1000)
+    assert poisson_scale(shape, 0) == 1.0
+    scales = [poisson_scale(shape, budget) for budget in (1, 70, 80, 150, 10000)]
+    assert scales == sorted(scales) and scales[-1] == 1.0
+    assert all(float(1 / scale).is_integer() for scale in scales)
+
+def test_poisson_matches_seamless_clone():
+    """Proche de cv2.seamlessClone à l'intérieur du masque, avec ou sans budget"""
+    scene, product, alpha = poisson_case()
+    x = y = 60
+    mask = (alpha > 127).astype(np.uint8) * 255
+    bx, by, bw, bh = cv2.boundingRect(mask)
+    reference = cv2.seamlessClone(product, scene, mask, (x + bx + bw // 2, y + by + bh // 2), cv2.NORMAL_CLONE)
+    inside = np.zeros(scene.shape[:2], bool)
+    inside[y:y + product.shape[0], x:x + product.shape[1]] = alpha > 127
+    
+    blended = blend_into(scene.copy(), product, alpha, x, y)
+    alpha_error = np.abs(blended.astype(np.float32) - reference)[inside].mean()
+    for budget in (0, 1):
+        result = poisson_blend_into(scene.copy(), product, alpha, x, y, budget)
+        error = np.abs(result.astype(np.float32) - reference)[inside].mean()
+        assert error < 4 and error < alpha_error / 5, (budget, error, alpha_error)
+
+if __name__ == "__main__":
+    print("Test de la fusion...")
+    test_blend_partially_outside()
+    test_blend_outside_canvas()
+    test_poisson_outside_canvas()
+    test_poisson_scale()
+    test_poisson_matches_seamless_clone()
+    print("Tous les tests sont passés")
@@ -0,0 +1,108 @@
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from download_models import ChecksumError, download_file, setup_models, verify_models
+
+PAYLOAD = bytes(range(256)) * 4096  # 1 Mo
+
+class ModelHandler(BaseHTTPRequestHandler):
+    """Serveur de modèles local: gère Range et peut couper la première réponse à mi-chemin"""
+
+    def do_GET(self):
+        server = self.server
+        server.ranges.append(self.headers.get("Range"))
+        start = 0
+        if self.headers.get("Range") and server.accept_ranges:
+            start = int(self.headers["Range"].split("=")[1].split("-")[0])
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(server.payload) - 1}/{len(server.payload)}")
+        else:
+            self.send_response(200)
+        body = server.payload[start:]
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        if server.drop_after is not None:
+            # Connexion coupée: le client doit reprendre là où il s'est arrêté
+            self.wfile.write(body[:server.drop_after])
+            server.drop_after = None
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@contextmanager
+def model_server(payload=PAYLOAD, drop_after=None, accept_ranges=True):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ModelHandler)
+    server.payload = payload
+    server.drop_after = drop_after
+    server.accept_ranges = accept_ranges
+    server.ranges = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server, f"http://127.0.0.1:{server.server_address[1]}/model.pt"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_download_verifies_checksum():
+    """Un fichier complet est renommé, un SHA-256 incorrect est rejeté"""
+    expected = hashlib.sha256(PAYLOAD).hexdigest()
+    with tempfile.TemporaryDirectory() as tmp, model_server() as (_, url):
+        path = Path(tmp) / "model.pt"
+        assert download_file(url, path, expected) == expected
+        assert path.read_bytes() == PAYLOAD
+
+        bad_path = Path(tmp) / "bad.pt"
+        try:
+            download_file(url, bad_path, "0" * 64)
+            assert False, "Empreinte invalide acceptée"
+        except ChecksumError:
+            pass
+        assert not bad_path.exists() and not bad_path.with_name("bad.pt.part").exists()
+
+def test_download_resumes():
+    """Une connexion coupée reprend avec un en-tête Range au lieu de tout retélécharger"""
+    expected = hashlib.sha256(PAYLOAD).hexdigest()
+    with tempfile.TemporaryDirectory() as tmp, model_server(drop_after=300000) as (server, url):
+        path = Path(tmp) / "model.pt"
+        assert download_file(url, path, expected) == expected
+        assert path.read_bytes() == PAYLOAD
+        assert server.ranges == [None, "bytes=300000-"]
+
+def test_download_restarts_without_range_support():
+    """Un serveur qui ignore Range renvoie tout: le fichier partiel est réécrit"""
+    expected = hashlib.sha256(PAYLOAD).hexdigest()
+    with tempfile.TemporaryDirectory() as tmp, model_server(accept_ranges=False) as (_, url):
+        path = Path(tmp) / "model.pt"
+        path.with_name("model.pt.part").write_bytes(b"x" * 1000)
+        assert download_file(url, path, expected) == expected
+        assert path.read_bytes() == PAYLOAD
+
+def test_setup_records_checksums():
+    """Les empreintes du premier téléchargement sont enregistrées puis vérifiées"""
+    with tempfile.TemporaryDirectory() as tmp, model_server() as (_, url):
+        manifest = {
+            name: {"url": url, "local_name": f"{name}.pt", "sha256": None}
+            for name in ("a", "b", "c")
+        }
+        assert setup_models(models_dir=tmp, manifest=manifest) == []
+        assert verify_models(tmp, manifest, check_hashes=True) == []
+
+        (Path(tmp) / "b.pt").write_bytes(b"corrompu")
+        assert verify_models(tmp, manifest, check_hashes=True) == ["b.pt"]
+
+if __name__ == "__main__":
+    print("Test du magasin de modèles...")
+    test_download_verifies_checksum()
+    test_download_resumes()
+    test_download_restarts_without_range_support()
+    test_setup_records_checksums()
+    print("Tous les tests sont passés")
@@ -0,0 +1,61 @@
+import os
+import sys
+import json
+import tempfile
+import subprocess
+from pathlib import Path
+
+HERE = Path(__file__).parent
+TEST_IMAGES = HERE.parent / "test-images"
+
+# Modules lourds qui ne doivent être importés que par les commandes qui utilisent un modèle
+HEAVY_MODULES = ("torch", "torchvision", "scipy", "onnxruntime", "models")
+
+# Budget d'import de image_processor (numpy + OpenCV compris), en ms
+IMPORT_BUDGET_MS = float(os.environ.get("IMPORT_BUDGET_MS", "1000"))
+
+def import_times(args):
+    """Lance python -X importtime; retourne {module: temps cumulé en ms} et la sortie standard"""
+    env = dict(os.environ, IMAGE_CACHE_MAX_MB="0")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=HERE, env=env, capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative) / 1000
+    return times, result.stdout
+
+def heavy_imports(times):
+    return sorted(name for name in times if name.split(".")[0] in HEAVY_MODULES)
+
+def test_import_skips_heavy_modules():
+    """Importer image_processor ne charge ni torch, ni scipy, ni les modèles"""
+    times, _ = import_times(["-c", "import image_processor"])
+    assert heavy_imports(times) == [], f"Imports lourds: {heavy_imports(times)[:5]}"
+
+def test_import_time_budget():
+    times, _ = import_times(["-c", "import image_processor"])
+    elapsed = times["image_processor"]
+    print(f"import image_processor: {elapsed:.0f} ms (cv2 {times.get('cv2', 0):.0f} ms, budget {IMPORT_BUDGET_MS:.0f} ms)")
+    assert elapsed <= IMPORT_BUDGET_MS, f"Import trop lent: {elapsed:.0f} ms"
+
+def test_cheap_cli_path():
+    """analyze avec la profondeur par gradient tourne sans importer torch"""
+    with tempfile.TemporaryDirectory() as tmp:
+        times, stdout = import_times([
+            "image_processor.py", "analyze", str(TEST_IMAGES / "background.png"), "gradient",
+            str(Path(tmp) / "scene.npz")
+        ])
+    assert json.loads(stdout)["success"]
+    assert heavy_imports(times) == [], f"Imports lourds: {heavy_imports(times)[:5]}"
+
+if __name__ == "__main__":
+    print("Test des temps d'import...")
+    test_import_skips_heavy_modules()
+    test_import_time_budget()
+    test_cheap_cli_path()
+    print("Tous les tests sont passés")
@@ -0,0 +1,54 @@
+import time
+import threading
+
+import numpy as np
+
+import profiling
+
+def test_stage_peak_rss():
+    """Une allocation libérée avant la fin de l'étape apparaît dans son pic, pas dans sa variation"""
+    with profiling.profile() as profiler:
+        with profiling.stage("allocation"):
+            buffer = np.ones(200 * 1024 * 1024 // 8)  # 200 Mo
+            time.sleep(0.05)
+            del buffer
+    stage = profiler.summary()["stages"]["allocation"]
+    if stage["peak_rss_mb"] is None:
+        print("/proc indisponible, test ignoré")
+        return
+    assert stage["peak_rss_mb"] - stage["rss_mb"] > 150
+    assert abs(stage["rss_delta_mb"]) < 50
+
+def test_peak_scope():
+    """Le pic est celui de la requête seule, ou celui du processus si une autre la chevauche"""
+    with profiling.profile() as profiler:
+        pass
+    alone = profiler.summary()["peak_rss_scope"]
+    assert alone in ("request", "process")
+
+    started = threading.Event()
+    release = threading.Event()
+    summaries = {}
+
+    def request(name):
+        with profiling.profile() as profiler:
+            started.set()
+            release.wait(5)
+        summaries[name] = profiler.summary()["peak_rss_scope"]
+
+    first = threading.Thread(target=request, args=("premier",))
+    first.start()
+    started.wait(5)
+    second = threading.Thread(target=request, args=("second",))
+    second.start()
+    time.sleep(0.05)
+    release.set()
+    first.join()
+    second.join()
+    assert summaries == {"premier": "process", "second": "process"}
+
+if __name__ == "__main__":
+    print("Test du profilage...")
+    test_stage_peak_rss()
+    test_peak_scope()
+    print("Tous les tests sont passés")
@@ -0,0 +1,49 @@
+import os
+import sys
+import json
+import time
+import socket
+import tempfile
+import subprocess
+from pathlib import Path
+
+HERE = Path(__file__).parent
+TEST_IMAGES = HERE.parent / "test-images"
+
+def test_socket_half_close():
+    """Un client qui ferme son côté écriture après ses requêtes reçoit toutes les réponses"""
+    with tempfile.TemporaryDirectory() as tmp:
+        socket_path = str(Path(tmp) / "image_processor.sock")
+        env = dict(os.environ, IMAGE_CACHE_MAX_MB="0")
+        server = subprocess.Popen(
+            [sys.executable, "image_processor.py", "serve", "--socket", socket_path],
+            cwd=HERE, env=env, stderr=subprocess.DEVNULL
+        )
+        try:
+            for _ in range(100):
+                if Path(socket_path).exists():
+                    break
+                time.sleep(0.1)
+            client = socket.socket(socket.AF_UNIX)
+            client.connect(socket_path)
+            for i in range(3):
+                request = {"id": i, "command": "analyze", "args": {
+                    "image_path": str(TEST_IMAGES / "background.png"), "depth_quality": "gradient"
+                }}
+                client.sendall((json.dumps(request) + "\n").encode("utf-8"))
+            client.shutdown(socket.SHUT_WR)
+            data = b""
+            while chunk := client.recv(65536):
+                data += chunk
+            client.close()
+            responses = [json.loads(line) for line in data.splitlines()]
+            assert sorted(response["id"] for response in responses) == [0, 1, 2]
+            assert all(response["success"] for response in responses)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+if __name__ == "__main__":
+    print("Test du mode serveur...")
+    test_socket_half_close()
+    print("Tous les tests sont passés")
@@ -0,0 +1,121 @@
+import os
+import sys
+import tempfile
+import subprocess
+import time
+from pathlib import Path
+
+from workers import WorkerPool, partition_cores
+
+HERE = Path(__file__).parent
+TEST_IMAGES = HERE.parent / "test-images"
+
+def worker_handler(request):
+    """Requête factice: attend, plante si demandé, et décrit le worker qui l'a traitée"""
+    if request.get("crash"):
+        os._exit(3)
+    time.sleep(request.get("sleep", 0))
+    return {
+        "id": request["id"],
+        "pid": os.getpid(),
+        "cores": sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else None,
+        "threads": os.environ.get("OMP_NUM_THREADS")
+    }
+
+def test_partition_cores():
+    """Ensembles disjoints et contigus, partagés un par un quand les workers dépassent les cœurs"""
+    assert partition_cores(3, range(8)) == [[0, 1, 2], [3, 4, 5], [6, 7]]
+    assert partition_cores(2, [4, 5, 6, 7]) == [[4, 5], [6, 7]]
+    assert partition_cores(3, [0, 1]) == [[0], [1], [0]]
+
+def test_pool_routes_to_idle_workers():
+    """Les requêtes sont réparties entre les workers, chacun limité à ses cœurs et ses threads"""
+    with WorkerPool(worker_handler, workers=2, threads_per_worker=1) as pool:
+        futures = [pool.submit({"id": i, "sleep": 0.05}) for i in range(6)]
+        responses = [future.result(timeout=30) for future in futures]
+    assert [response["id"] for response in responses] == list(range(6))
+    assert len({response["pid"] for response in responses}) == 2
+    assert all(response["threads"] == "1" for response in responses)
+    assert {tuple(response["cores"]) for response in responses} <= {tuple(cores) for cores in pool.core_sets}
+
+def test_pool_replaces_crashed_worker():
+    """Un worker qui meurt fait échouer sa requête, puis est remplacé"""
+    with WorkerPool(worker_handler, workers=1) as pool:
+        first_pid = pool.submit({"id": "avant"}).result(timeout=30)["pid"]
+        try:
+            pool.submit({"id": "crash", "crash": True}).result(timeout=30)
+            assert False, "La requête aurait dû échouer"
+        except RuntimeError:
+            pass
+        response = pool.submit({"id": "après"}).result(timeout=30)
+    assert response["id"] == "après" and response["pid"] != first_pid
+
+def print_handler(request):
+    print("affichage du traitement")
+    return {"id": request["id"]}
+
+def test_worker_output_goes_to_stderr():
+    """Ce qu'affiche un worker ne doit pas se mêler aux réponses écrites sur stdout"""
+    script = (
+        "from workers import WorkerPool\n"
+        "from test_workers import print_handler\n"
+        "with WorkerPool(print_handler, workers=1) as pool:\n"
+        "    pool.submit({'id': 1}).result(timeout=30)\n"
+    )
+    result = subprocess.run([sys.executable, "-c", script], cwd=HERE, capture_output=True, text=True, check=True)
+    assert result.stdout == ""
+    assert "affichage du traitement" in result.stderr
+
+def test_composite_matrix_in_worker():
+    """composite-matrix tourne dans un worker du pool, qui ne peut pas créer de processus"""
+    from image_processor import handle_request
+    with tempfile.TemporaryDirectory() as tmp, WorkerPool(handle_request, workers=1) as pool:
+        response = pool.submit({"id": "matrice", "command": "composite-matrix", "args": {
+            "products": [str(TEST_IMAGES / "product.jpg")],
+            "scenes": [str(TEST_IMAGES / "background.png")] * 2,
+            "output_dir": tmp,
+            "workers": 2
+        }}).result(timeout=300)
+        assert response["success"], response.get("error")
+        assert len(response["results"]) == 2
+        assert all(result["success"] for result in response["results"]), response["results"]
+        assert all(Path(result["path"]).exists() for result in response["results"])
+
+def test_concurrent_composite_matrix():
+    """Des requêtes composite-matrix simultanées (serve --jobs) ne mélangent pas leurs scènes"""
+    import cv2
+    from concurrent.futures import ThreadPoolExecutor
+    from image_processor import composite_matrix
+
+    with tempfile.TemporaryDirectory() as tmp:
+        background = cv2.imread(str(TEST_IMAGES / "background.png"))
+        scenes = []
+        for i in range(4):
+            # Scènes distinctes jusque dans les coins (fond assombri d'une valeur différente)
+            path = Path(tmp) / f"scene{i}.png"
+            cv2.imwrite(str(path), cv2.subtract(background, (40 * i, 30 * i, 20 * i, 0)))
+            scenes.append(str(path))
+
+        def run(index):
+            products = [str(TEST_IMAGES / "test-image.png")] * 8
+            return list(composite_matrix(products, [scenes[index]], Path(tmp) / f"out{index}", workers=1))
+
+        with ThreadPoolExecutor(max_workers=len(scenes)) as executor:
+            results = list(executor.map(run, range(len(scenes))))
+
+        # Le produit est centré: les coins du résultat sont ceux de la scène de la requête
+        for scene, responses in zip(scenes, results):
+            corner = cv2.imread(scene)[:40, :40]
+            for response in responses:
+                assert response["success"], response.get("error")
+                assert (cv2.imread(response["path"])[:40, :40] == corner).all(), response["path"]
+
+if __name__ == "__main__":
+    print("Test du pool de workers...")
+    test_partition_cores()
+    test_pool_routes_to_idle_workers()
+    test_pool_replaces_crashed_worker()
+    test_worker_output_goes_to_stderr()
+    test_composite_matrix_in_worker()
+    test_concurrent_composite_matrix()
+    print("Tous les tests sont passés")
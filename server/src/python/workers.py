@@ -0,0 +1,223 @@
+import os
+import sys
+import signal
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing.connection import wait
+
+import cv2
+
+# Bibliothèques de calcul dont le nombre de threads est fixé par worker
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+def available_cores():
+    """Cœurs utilisables par ce processus (affinité CPU si le système la fournit)"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def partition_cores(count, cores=None):
+    """Répartit les cœurs en count ensembles disjoints et contigus de tailles égales (à un près)
+
+    Avec plus de workers que de cœurs, les workers se partagent les cœurs un par un.
+    """
+    cores = list(cores if cores is not None else available_cores())
+    if count >= len(cores):
+        return [[cores[i % len(cores)]] for i in range(count)]
+    size, extra = divmod(len(cores), count)
+    sets = []
+    start = 0
+    for i in range(count):
+        end = start + size + (1 if i < extra else 0)
+        sets.append(cores[start:end])
+        start = end
+    return sets
+
+def configure_threads(cores, threads):
+    """Limite le processus courant à ses cœurs et fixe le nombre de threads de chaque bibliothèque
+
+    PyTorch (intra-op), OpenCV et les BLAS de NumPy utilisent chacun threads threads; l'inter-op
+    de PyTorch est ramené à 1 (un worker traite une requête à la fois).
+    """
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    cv2.setNumThreads(threads)
+
+    # torch n'est réglé que s'il est déjà chargé (sinon OMP_NUM_THREADS s'appliquera à son import)
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass  # Déjà fixé ou pool inter-op déjà démarré
+
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(threads)
+    except ImportError:
+        pass
+
+def _worker_main(handler, conn, cores, threads):
+    """Boucle d'un worker: reçoit une requête, renvoie la réponse de handler, jusqu'à None"""
+    # Ctrl+C est géré par le processus principal, qui arrête les workers proprement
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # Les réponses passent par conn: stdout (hérité du parent, parfois le canal du protocole)
+    # ne doit recevoir aucun affichage des traitements
+    sys.stdout = sys.stderr
+    configure_threads(cores, threads)
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        try:
+            response = handler(request)
+        except Exception as e:
+            response = {"id": request.get("id"), "success": False, "error": str(e)}
+        conn.send(response)
+    conn.close()
+
+class WorkerPool:
+    """Pool de processus dédiés chacun à un ensemble de cœurs, alimentés par un ordonnanceur
+
+    Les workers sont créés par fork: les modèles chargés avant la création du pool sont
+    partagés en copie sur écriture. Chaque requête part vers un worker libre (file d'attente
+    FIFO sinon). Même interface que les executors: submit() retourne un Future.
+    """
+
+    def __init__(self, handler, workers=None, threads_per_worker=None, cores=None):
+        cores = cores if cores is not None else available_cores()
+        if workers is None:
+            # Par défaut, autant de workers que de cœurs ne dépassant pas threads_per_worker chacun
+            workers = max(1, len(cores) // (threads_per_worker or 1))
+        self.handler = handler
+        self.core_sets = partition_cores(workers, cores)
+        self.threads = [threads_per_worker or len(core_set) for core_set in self.core_sets]
+        self._context = multiprocessing.get_context("fork")
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._idle = deque()
+        self._running = {}
+        self._closing = False
+
+        self._processes = []
+        self._conns = []
+        for index in range(workers):
+            self._start_worker(index)
+        self._idle.extend(range(workers))
+
+        # Réveille le collecteur pour qu'il prenne en compte l'arrêt
+        self._wakeup_reader, self._wakeup_writer = self._context.Pipe(duplex=False)
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def _start_worker(self, index):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(self.handler, child_conn, self.core_sets[index], self.threads[index]),
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        if index < len(self._processes):
+            self._processes[index] = process
+            self._conns[index] = parent_conn
+        else:
+            self._processes.append(process)
+            self._conns.append(parent_conn)
+
+    def submit(self, request):
+        """Planifie une requête; le Future reçoit la réponse du worker"""
+        future = Future()
+        with self._lock:
+            if self._closing:
+                raise RuntimeError("Pool de workers arrêté")
+            if self._idle:
+                self._dispatch(self._idle.popleft(), request, future)
+            else:
+                self._pending.append((request, future))
+        self._wakeup()
+        return future
+
+    def _dispatch(self, index, request, future):
+        self._running[index] = future
+        try:
+            self._conns[index].send(request)
+        except OSError:
+            # Worker mort entre deux requêtes: il est remplacé et reçoit la requête
+            self._restart_worker(index)
+            self._conns[index].send(request)
+
+    def _restart_worker(self, index):
+        self._processes[index].join()
+        self._conns[index].close()
+        self._start_worker(index)
+
+    def _collect(self):
+        """Récupère les réponses et donne la requête suivante au worker qui vient de se libérer"""
+        while True:
+            with self._lock:
+                conns = {self._conns[index]: index for index in self._running}
+                if self._closing and not conns and not self._pending:
+                    return
+            ready = wait(list(conns) + [self._wakeup_reader])
+            for conn in ready:
+                if conn is self._wakeup_reader:
+                    conn.recv()
+                    continue
+                index = conns[conn]
+                try:
+                    response = conn.recv()
+                    error = None
+                except (EOFError, OSError):
+                    response = None
+                    error = RuntimeError(f"Le worker {index} s'est arrêté pendant la requête")
+
+                with self._lock:
+                    future = self._running.pop(index)
+                    if error is not None:
+                        self._restart_worker(index)
+                    if self._pending:
+                        self._dispatch(index, *self._pending.popleft())
+                    else:
+                        self._idle.append(index)
+
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(response)
+
+    def _wakeup(self):
+        self._wakeup_writer.send(None)
+
+    def shutdown(self, wait=True):
+        """Arrêt: termine les requêtes en cours et en attente, puis arrête les workers"""
+        with self._lock:
+            self._closing = True
+        self._wakeup()
+        if wait:
+            self._collector.join()
+        for conn in self._conns:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        for process in self._processes:
+            process.join(timeout=5 if wait else 0)
+            if process.is_alive():
+                process.terminate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
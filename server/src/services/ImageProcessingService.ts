@@ -1,6 +1,8 @@
-import { spawn } from 'child_process';
+import { spawn, ChildProcess } from 'child_process';
 import path from 'path';
+import readline from 'readline';
 import { promises as fs } from 'fs';
+import { logger } from '../config/logger';
 
 interface ProcessedImage {
   url: string;
@@ -37,51 +39,143 @@ interface StyleGuide {
 interface ProcessResult {
   success: boolean;
   path?: string;
+  image?: string;
+  format?: string;
+  style_guide?: StyleGuide;
   error?: string;
 }
 
+// Image passée au worker: chemin de fichier ou contenu encodé (PNG, JPEG, WebP), transmis en base64
+type ImageInput = string | Buffer;
+
+interface ProcessedBuffer {
+  image: Buffer;
+  format: string;
+  styleGuide?: StyleGuide;
+}
+
 interface AnalyzeResult {
   success: boolean;
   style_guide?: StyleGuide;
   error?: string;
 }
 
+interface PendingRequest {
+  resolve: (value: string) => void;
+  reject: (error: Error) => void;
+  timer: NodeJS.Timeout;
+}
+
 export class ImageProcessingService {
   private static pythonScript = path.join(process.cwd(), 'src', 'python', 'image_processor.py');
   private static pythonPath = path.join(process.cwd(), 'venv', 'bin', 'python3');
 
-  private static async runPythonScript(args: string[]): Promise<string> {
-    return new Promise((resolve, reject) => {
-      const pythonProcess = spawn(this.pythonPath, [this.pythonScript, ...args]);
-      
-      let output = '';
-      let errorOutput = '';
+  // Processus Python persistant (mode serve): les modèles restent chargés entre les requêtes
+  private static worker: ChildProcess | null = null;
+  private static pendingRequests = new Map<string, PendingRequest>();
+  private static nextRequestId = 0;
+  // Mesures par étape (décodage, inférence, fusion...) renvoyées par le worker et journalisées
+  private static profile = process.env.IMAGE_PROCESSING_PROFILE === 'true';
+  // Délai maximal d'une requête: un worker bloqué ne laisse pas ses appelants en attente indéfiniment
+  private static requestTimeoutMs = Number(process.env.IMAGE_PROCESSING_TIMEOUT_MS) || 120000;
 
-      pythonProcess.stdout.on('data', (data) => {
-        output += data.toString();
-      });
+  private static getWorker(): ChildProcess {
+    if (this.worker) {
+      return this.worker;
+    }
 
-      pythonProcess.stderr.on('data', (data) => {
-        errorOutput += data.toString();
-      });
+    const worker = spawn(this.pythonPath, [this.pythonScript, 'serve', '--preload']);
+    const lines = readline.createInterface({ input: worker.stdout! });
 
-      pythonProcess.on('close', (code) => {
-        if (code !== 0) {
-          reject(new Error(`Python script failed with code ${code}: ${errorOutput}`));
-        } else {
-          resolve(output.trim());
-        }
-      });
+    lines.on('line', (line) => {
+      let response: { id?: string | null };
+      try {
+        response = JSON.parse(line);
+      } catch {
+        console.error('Invalid response from image processor:', line);
+        return;
+      }
+
+      const pending = this.pendingRequests.get(String(response.id));
+      if (pending) {
+        this.pendingRequests.delete(String(response.id));
+        clearTimeout(pending.timer);
+        pending.resolve(line);
+      }
+    });
+
+    worker.stderr!.on('data', (data) => {
+      console.error(`[image_processor] ${data.toString().trim()}`);
+    });
 
-      pythonProcess.on('error', (error) => {
-        reject(error);
+    const failPending = (error: Error) => {
+      // Un worker déjà remplacé ne doit pas faire échouer les requêtes du suivant
+      if (this.worker !== worker) {
+        return;
+      }
+      this.worker = null;
+      this.pendingRequests.forEach((pending) => {
+        clearTimeout(pending.timer);
+        pending.reject(error);
       });
+      this.pendingRequests.clear();
+    };
+
+    worker.on('exit', (code) => {
+      failPending(new Error(`Python worker exited with code ${code}`));
+    });
+
+    worker.on('error', (error) => {
+      failPending(error);
+    });
+
+    // EPIPE quand le processus meurt entre deux requêtes: sans ce gestionnaire, l'erreur de flux
+    // non gérée arrêterait le serveur Node
+    worker.stdin!.on('error', (error) => {
+      failPending(error);
+      worker.kill();
+    });
+
+    this.worker = worker;
+    return worker;
+  }
+
+  private static async runPythonCommand(command: string, args: Record<string, unknown>): Promise<string> {
+    const worker = this.getWorker();
+    const id = String(++this.nextRequestId);
+
+    const line = await new Promise<string>((resolve, reject) => {
+      const timer = setTimeout(() => {
+        this.pendingRequests.delete(id);
+        reject(new Error(`Image processor request ${command} timed out after ${this.requestTimeoutMs} ms`));
+      }, this.requestTimeoutMs);
+      this.pendingRequests.set(id, { resolve, reject, timer });
+      worker.stdin!.write(JSON.stringify({ id, command, args, profile: this.profile }) + '\n');
     });
+
+    if (this.profile) {
+      const { timings } = JSON.parse(line);
+      if (timings) {
+        logger.info(`Image processor timings (${command})`, timings);
+      }
+    }
+    return line;
+  }
+
+  private static imageArg(image: ImageInput): string | { base64: string } {
+    return Buffer.isBuffer(image) ? { base64: image.toString('base64') } : image;
+  }
+
+  static shutdown(): void {
+    if (this.worker) {
+      this.worker.stdin!.write(JSON.stringify({ command: 'shutdown' }) + '\n');
+      this.worker.stdin!.end();
+    }
   }
 
   static async processProductImage(
-    generatedImagePath: string,
-    productImagePath: string,
+    generatedImagePath: ImageInput,
+    productImagePath: ImageInput,
     styleGuide?: StyleGuide
   ): Promise<ProcessedImage> {
     try {
@@ -91,31 +185,13 @@ export class ImageProcessingService {
         // Créer le chemin de sortie dans public/images
         const outputPath = path.join(process.cwd(), 'public', 'images', `processed_${Date.now()}.png`);
 
-        // Analyser d'abord l'image générée pour extraire le style
-        const styleAnalysis = await this.runPythonScript(['analyze', generatedImagePath]);
-        const styleResult = JSON.parse(styleAnalysis);
-
-        if (!styleResult.success) {
-          throw new Error(styleResult.error || 'Failed to analyze generated image');
-        }
-
-        // Fusionner le style guide fourni avec l'analyse
-        const combinedStyle = {
-          ...styleResult.style_guide,
-          ...styleGuide
-        };
-
-        // Préparer les arguments pour le traitement
-        const args = [
-          'process',
-          generatedImagePath,
-          productImagePath,
-          outputPath,
-          JSON.stringify(combinedStyle)
-        ];
-
-        // Exécuter le script Python
-        const result = await this.runPythonScript(args);
+        // Analyser la scène et intégrer le produit en un seul passage (images décodées une seule fois)
+        const result = await this.runPythonCommand('composite', {
+          generated_path: this.imageArg(generatedImagePath),
+          product_path: this.imageArg(productImagePath),
+          output_path: outputPath,
+          style_guide: styleGuide
+        });
         const processResult: ProcessResult = JSON.parse(result);
 
         if (!processResult.success) {
@@ -131,7 +207,7 @@ export class ImageProcessingService {
           height: 1024,
           format: 'png'
         },
-        styleGuide: combinedStyle
+        styleGuide: processResult.style_guide
       };
     } catch (error) {
       console.error('Error in processProductImage:', error);
@@ -139,13 +215,39 @@ export class ImageProcessingService {
     }
   }
 
-  static async analyzeStyleGuide(imagePath: string): Promise<StyleGuide> {
+  // Variante sans fichier: les images transitent en base64 sur la connexion au worker
+  static async processProductImageBuffer(
+    generatedImage: ImageInput,
+    productImage: ImageInput,
+    styleGuide?: StyleGuide,
+    format: 'png' | 'webp' | 'jpg' = 'png'
+  ): Promise<ProcessedBuffer> {
+    const result = await this.runPythonCommand('composite', {
+      generated_path: this.imageArg(generatedImage),
+      product_path: this.imageArg(productImage),
+      output_path: { format },
+      style_guide: styleGuide
+    });
+    const processResult: ProcessResult = JSON.parse(result);
+
+    if (!processResult.success || !processResult.image) {
+      throw new Error(processResult.error || 'Failed to process image');
+    }
+
+    return {
+      image: Buffer.from(processResult.image, 'base64'),
+      format: processResult.format || format,
+      styleGuide: processResult.style_guide
+    };
+  }
+
+  static async analyzeStyleGuide(imagePath: ImageInput): Promise<StyleGuide> {
     try {
       // Vérifier que le script Python existe
       await fs.access(this.pythonScript);
 
       // Exécuter le script Python
-      const result = await this.runPythonScript(['analyze', imagePath]);
+      const result = await this.runPythonCommand('analyze', { image_path: this.imageArg(imagePath) });
       const analyzeResult: AnalyzeResult = JSON.parse(result);
 
       if (!analyzeResult.success || !analyzeResult.style_guide) {